@@ -0,0 +1,123 @@
+import calendar
+import re
+from datetime import date, timedelta
+
+MONTHS = {}
+for number in range(1, 13):
+    MONTHS[calendar.month_name[number].lower()] = number
+    MONTHS[calendar.month_abbr[number].lower()] = number
+MONTHS['sept'] = 9
+# (first month, last month); winter runs into the next year
+SEASONS = {'spring': (3, 5), 'summer': (6, 8), 'autumn': (9, 11), 'fall': (9, 11), 'winter': (12, 2)}
+# Parts of a year as month ranges and of a decade as year offsets
+YEAR_PARTS = {'early': (1, 4), 'mid': (5, 8), 'late': (9, 12)}
+DECADE_PARTS = {'early': (0, 3), 'mid': (3, 6), 'late': (6, 9)}
+# Widest range parse_date_range returns (a decade); lets range filters bound date_start from below
+DATE_RANGE_MAX_DAYS = 3653
+
+FILLER_RE = re.compile(r"\b(?:circa|ca\.|c\.|around|about|approximately|approx\.|the|in|of)\s*")
+PART = r'(?:(early|mid|late)\s+)?'
+MONTH = r'([a-z]+)\.?'
+DAY = r'(\d{1,2})(?:st|nd|rd|th)?'
+PATTERNS = [
+    ('iso_day', re.compile(r'^(\d{4})-(\d{1,2})-(\d{1,2})(?:[t ].*)?$')),
+    ('iso_month', re.compile(r'^(\d{4})-(\d{1,2})$')),
+    ('slash_day', re.compile(r'^(\d{1,2})/(\d{1,2})/(\d{4})$')),
+    ('decade', re.compile(rf"^{PART}(\d{{3}})0'?s$")),
+    ('year', re.compile(rf'^{PART}(\d{{4}})$')),
+    ('season', re.compile(r'^(spring|summer|autumn|fall|winter)\s+(\d{4})$')),
+    ('month_day', re.compile(rf'^{MONTH}\s+{DAY}\s+(\d{{4}})$')),
+    ('day_month', re.compile(rf'^{DAY}\s+{MONTH}\s+(\d{{4}})$')),
+    ('month', re.compile(rf'^{PART}{MONTH}\s+(\d{{4}})$')),
+]
+
+def _month_end(year, month):
+    return date(year, month, calendar.monthrange(year, month)[1])
+
+def _month(name):
+    if name not in MONTHS:
+        raise ValueError(f"Unknown month {name!r}")
+    return MONTHS[name]
+
+def _range(kind, groups):
+    if kind == 'iso_day':
+        day = date(int(groups[0]), int(groups[1]), int(groups[2]))
+        return day, day
+    if kind == 'iso_month':
+        year, month = int(groups[0]), int(groups[1])
+        return date(year, month, 1), _month_end(year, month)
+    if kind == 'slash_day':
+        first, second, year = int(groups[0]), int(groups[1]), int(groups[2])
+        # Month first (US) unless that cannot be a month
+        month, day = (second, first) if first > 12 else (first, second)
+        value = date(year, month, day)
+        return value, value
+    if kind == 'decade':
+        part, decade = groups[0], int(groups[1]) * 10
+        low, high = DECADE_PARTS.get(part, (0, 9))
+        return date(decade + low, 1, 1), date(decade + high, 12, 31)
+    if kind == 'year':
+        part, year = groups[0], int(groups[1])
+        low, high = YEAR_PARTS.get(part, (1, 12))
+        return date(year, low, 1), _month_end(year, high)
+    if kind == 'season':
+        first, last = SEASONS[groups[0]]
+        year = int(groups[1])
+        # "winter 1962" is the winter that starts in December 1962
+        return date(year, first, 1), _month_end(year + 1 if last < first else year, last)
+    if kind == 'month_day':
+        value = date(int(groups[2]), _month(groups[0]), int(groups[1]))
+        return value, value
+    if kind == 'day_month':
+        value = date(int(groups[2]), _month(groups[1]), int(groups[0]))
+        return value, value
+    if kind == 'month':
+        year, month = int(groups[2]), _month(groups[1])
+        return date(year, month, 1), _month_end(year, month)
+    raise ValueError(kind)
+
+def parse_date_range(value):
+    """
+    First and last day covered by a free-form story date, or (None, None) when it
+    cannot be read. Handles ISO dates and months, 6/14/1962, "June 14, 1962",
+    "14 June 1962", "June 1962", "1962", "early 1962", "summer 1962", "1950s",
+    "late 1950s" and "circa ..." versions of these.
+    """
+    if value is None:
+        return None, None
+    if isinstance(value, date):
+        return value, value
+    text = ' '.join(FILLER_RE.sub(' ', str(value).lower().replace(',', ' ').replace('-', ' - ')).split())
+    # Put ISO dashes back together and split "mid-1960s"
+    text = re.sub(r'(\d) - (\d)', r'\1-\2', text).replace(' - ', ' ')
+    for kind, pattern in PATTERNS:
+        match = pattern.match(text)
+        if match:
+            try:
+                return _range(kind, match.groups())
+            except ValueError:
+                return None, None
+    return None, None
+
+def window_bounds(date_from, date_to):
+    """
+    Typed bounds for a ?from=&to= filter, each accepting anything parse_date_range
+    reads ("1950s" as from means 1950-01-01, as to 1959-12-31). Raises ValueError.
+    """
+    start = end = None
+    if date_from:
+        start = parse_date_range(date_from)[0]
+        if start is None:
+            raise ValueError(f"Cannot read date {date_from!r}")
+    if date_to:
+        end = parse_date_range(date_to)[1]
+        if end is None:
+            raise ValueError(f"Cannot read date {date_to!r}")
+    return start, end
+
+def earliest_overlapping_start(start):
+    """Lowest date_start a story overlapping a window that begins at `start` can have."""
+    if start - date.min <= timedelta(days=DATE_RANGE_MAX_DAYS):
+        # Windows starting in the first decade AD would step below year 1
+        return date.min
+    return start - timedelta(days=DATE_RANGE_MAX_DAYS)
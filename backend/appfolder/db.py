@@ -0,0 +1,56 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+import asyncpg
+from fastapi import HTTPException, Request
+from dotenv import load_dotenv
+
+load_dotenv(dotenv_path='appfolder/.env')
+DATABASE_URL = os.getenv('SUPABASE_DB_URL')
+
+# Pool settings (override in appfolder/.env)
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '2'))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+DB_POOL_ACQUIRE_TIMEOUT = float(os.getenv('DB_POOL_ACQUIRE_TIMEOUT', '10'))
+# Set to 0 when going through the Supabase transaction pooler (pgbouncer)
+DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '100'))
+# Idle connections are closed after this many seconds
+DB_POOL_MAX_INACTIVE_LIFETIME = float(os.getenv('DB_POOL_MAX_INACTIVE_LIFETIME', '300'))
+# Connections are recycled after serving this many queries
+DB_POOL_MAX_QUERIES = int(os.getenv('DB_POOL_MAX_QUERIES', '50000'))
+# Apply pending schema migrations when the app starts (otherwise run `python migrate.py apply`)
+DB_MIGRATE_ON_STARTUP = os.getenv('DB_MIGRATE_ON_STARTUP', '1') == '1'
+
+async def create_pool():
+    return await asyncpg.create_pool(
+        DATABASE_URL,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+        max_inactive_connection_lifetime=DB_POOL_MAX_INACTIVE_LIFETIME,
+        max_queries=DB_POOL_MAX_QUERIES,
+    )
+
+@asynccontextmanager
+async def acquire(request: Request):
+    """
+    Borrow a pooled connection, with the same 503 as get_conn when the pool is
+    exhausted. For handlers that only sometimes need the database.
+    """
+    pool = request.app.state.pool
+    try:
+        conn = await pool.acquire(timeout=DB_POOL_ACQUIRE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Database is busy, try again")
+    try:
+        yield conn
+    finally:
+        await pool.release(conn)
+
+async def get_conn(request: Request):
+    """
+    FastAPI dependency that lends a pooled connection for the duration of a request.
+    The connection goes back to the pool even if the handler raises.
+    """
+    async with acquire(request) as conn:
+        yield conn
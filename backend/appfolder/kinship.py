@@ -0,0 +1,335 @@
+import asyncio
+import os
+import time
+from array import array
+from collections import OrderedDict, deque
+from fastapi import Request
+
+# Per-user graphs kept in memory (override in appfolder/.env)
+KINSHIP_CACHE_SIZE = int(os.getenv('KINSHIP_CACHE_SIZE', '64'))
+# Upper bound on staleness for writes made outside this process (other workers, SQL console)
+KINSHIP_CACHE_TTL = float(os.getenv('KINSHIP_CACHE_TTL', '300'))
+
+ORDINALS = {1: "first", 2: "second", 3: "third", 4: "fourth", 5: "fifth", 6: "sixth", 7: "seventh", 8: "eighth", 9: "ninth", 10: "tenth"}
+REMOVED = {1: "once removed", 2: "twice removed", 3: "three times removed"}
+
+def _csr(n, pairs):
+    """Compressed adjacency: neighbours of node i are targets[offsets[i]:offsets[i + 1]]."""
+    offsets = array('i', [0] * (n + 1))
+    for source, _ in pairs:
+        offsets[source + 1] += 1
+    for i in range(n):
+        offsets[i + 1] += offsets[i]
+    targets = array('i', [0] * len(pairs))
+    fill = array('i', offsets[:n])
+    for source, target in pairs:
+        targets[fill[source]] = target
+        fill[source] += 1
+    return offsets, targets
+
+def _gendered(gender, male, female, neutral):
+    return male if gender == 'M' else female if gender == 'F' else neutral
+
+def _greats(n, base):
+    # n = 0 -> base, 1 -> great-base, 3 -> great-great-great-base
+    return "great-" * n + base
+
+class KinshipGraph:
+    """
+    One user's family and friendship graph. People are mapped to dense integer
+    indexes and edges are stored as compressed adjacency arrays. Every person's
+    ancestors (with generation distance) are computed once when the graph is built.
+    """
+
+    def __init__(self, people, relationships, friendships):
+        self.ids = array('i', [p['id'] for p in people])
+        self.index = {person_id: i for i, person_id in enumerate(self.ids)}
+        self.names = [p['name'] for p in people]
+        self.genders = [p['gender'] for p in people]
+        n = len(self.ids)
+        child_of = []
+        for r in relationships:
+            parent, child = self.index.get(r['parent_id']), self.index.get(r['child_id'])
+            if parent is not None and child is not None and parent != child:
+                child_of.append((child, parent))
+        friend_of = []
+        for f in friendships:
+            a, b = self.index.get(f['person1_id']), self.index.get(f['person2_id'])
+            if a is not None and b is not None and a != b:
+                friend_of += [(a, b), (b, a)]
+        self.parents = _csr(n, child_of)
+        self.children = _csr(n, [(parent, child) for child, parent in child_of])
+        self.friends = _csr(n, friend_of)
+        self.ancestors = self._build_ancestors(n)
+
+    def _neighbours(self, adjacency, i):
+        offsets, targets = adjacency
+        return targets[offsets[i]:offsets[i + 1]]
+
+    def _build_ancestors(self, n):
+        # Parents before children (Kahn's algorithm) so each person's map is built from
+        # its parents' maps. People stuck in a cycle of bad data fall back to a BFS.
+        ancestors = [None] * n
+        pending = array('i', [len(self._neighbours(self.parents, i)) for i in range(n)])
+        queue = deque(i for i in range(n) if pending[i] == 0)
+        while queue:
+            i = queue.popleft()
+            mine = {}
+            for parent in self._neighbours(self.parents, i):
+                if mine.get(parent, 2) > 1:
+                    mine[parent] = 1
+                for ancestor, distance in ancestors[parent].items():
+                    if mine.get(ancestor, distance + 2) > distance + 1:
+                        mine[ancestor] = distance + 1
+            ancestors[i] = mine
+            for child in self._neighbours(self.children, i):
+                pending[child] -= 1
+                if pending[child] == 0:
+                    queue.append(child)
+        for i in range(n):
+            if ancestors[i] is None:
+                ancestors[i] = self._walk_up(i)
+        return ancestors
+
+    def _walk_up(self, i):
+        found = {}
+        frontier = [i]
+        distance = 0
+        while frontier:
+            distance += 1
+            next_frontier = []
+            for person in frontier:
+                for parent in self._neighbours(self.parents, person):
+                    if parent != i and parent not in found:
+                        found[parent] = distance
+                        next_frontier.append(parent)
+            frontier = next_frontier
+        return found
+
+    def __contains__(self, person_id):
+        return person_id in self.index
+
+    def _edges(self, i):
+        for j in self._neighbours(self.parents, i):
+            yield j
+        for j in self._neighbours(self.children, i):
+            yield j
+        for j in self._neighbours(self.friends, i):
+            yield j
+
+    def _edge_type(self, i, j):
+        """What i is to j: 'parent', 'child' or 'friend'."""
+        if i in self._neighbours(self.parents, j):
+            return 'parent'
+        if i in self._neighbours(self.children, j):
+            return 'child'
+        return 'friend'
+
+    def shortest_path(self, a, b):
+        """Person ids on a shortest path between a and b over family and friend edges, or None."""
+        start, goal = self.index[a], self.index[b]
+        if start == goal:
+            return [a]
+        # Bidirectional BFS: always expand the smaller frontier
+        came_from = {start: None}
+        came_to = {goal: None}
+        forward, backward = [start], [goal]
+        meet = None
+        while forward and backward and meet is None:
+            if len(forward) <= len(backward):
+                forward, meet = self._expand(forward, came_from, came_to)
+            else:
+                backward, meet = self._expand(backward, came_to, came_from)
+        if meet is None:
+            return None
+        path = []
+        node = meet
+        while node is not None:
+            path.append(node)
+            node = came_from[node]
+        path.reverse()
+        node = came_to[meet]
+        while node is not None:
+            path.append(node)
+            node = came_to[node]
+        return [self.ids[i] for i in path]
+
+    def _expand(self, frontier, seen, other_seen):
+        next_frontier = []
+        for i in frontier:
+            for j in self._edges(i):
+                if j not in seen:
+                    seen[j] = i
+                    if j in other_seen:
+                        return next_frontier, j
+                    next_frontier.append(j)
+        return next_frontier, None
+
+    def path_steps(self, path):
+        return [
+            {"from": x, "to": y, "type": self._edge_type(self.index[x], self.index[y])}
+            for x, y in zip(path, path[1:])
+        ]
+
+    def blood_relation(self, a, b):
+        """
+        How a is related to b by descent, via their lowest common ancestor.
+        Returns (label, common_ancestor_id, generations_from_a, generations_from_b) or None.
+        """
+        i, j = self.index[a], self.index[b]
+        if i == j:
+            return "self", a, 0, 0
+        from_a = dict(self.ancestors[i])
+        from_a[i] = 0
+        from_b = dict(self.ancestors[j])
+        from_b[j] = 0
+        best = None
+        for ancestor, da in from_a.items():
+            db = from_b.get(ancestor)
+            if db is not None and (best is None or da + db < best[1] + best[2]):
+                best = (ancestor, da, db)
+        if best is None:
+            return None
+        ancestor, da, db = best
+        shared = sum(1 for anc, d in from_a.items() if d == da and from_b.get(anc) == db)
+        return self._label(self.genders[i], da, db, shared), self.ids[ancestor], da, db
+
+    def _label(self, gender, da, db, shared):
+        if da == 0:
+            base = _gendered(gender, "father", "mother", "parent")
+            return base if db == 1 else _greats(db - 2, "grand" + base)
+        if db == 0:
+            base = _gendered(gender, "son", "daughter", "child")
+            return base if da == 1 else _greats(da - 2, "grand" + base)
+        if da == 1 and db == 1:
+            sibling = _gendered(gender, "brother", "sister", "sibling")
+            return sibling if shared > 1 else "half-" + sibling
+        if da == 1:
+            return _greats(db - 2, _gendered(gender, "uncle", "aunt", "aunt/uncle"))
+        if db == 1:
+            return _greats(da - 2, _gendered(gender, "nephew", "niece", "niece/nephew"))
+        degree = min(da, db) - 1
+        removed = abs(da - db)
+        label = f"{ORDINALS.get(degree, f'{degree}th')} cousin"
+        if removed:
+            label += " " + REMOVED.get(removed, f"{removed} times removed")
+        return label
+
+    def kinship(self, a, b):
+        """Blood relation if there is one, otherwise a label composed along the shortest path."""
+        blood = self.blood_relation(a, b)
+        if blood:
+            label, ancestor, da, db = blood
+            return {"relationship": label, "common_ancestor": ancestor, "generations": [da, db], "path": None}
+        path = self.shortest_path(a, b)
+        if path is None:
+            return {"relationship": None, "common_ancestor": None, "generations": None, "path": None}
+        # Split the path at friend edges and label each family segment.
+        # "a is X of (Y of b)" reads as "X of Y", e.g. "friend of sister".
+        labels = []
+        segment = []
+        for step in self.path_steps(path) + [None]:
+            if step is None or step["type"] == "friend":
+                if segment:
+                    labels.append(self._segment_label(segment))
+                    segment = []
+                if step:
+                    labels.append("friend")
+            else:
+                segment.append(step)
+        return {"relationship": " of ".join(labels), "common_ancestor": None, "generations": None, "path": path}
+
+    def _segment_label(self, steps):
+        blood = self.blood_relation(steps[0]["from"], steps[-1]["to"])
+        if blood:
+            return blood[0]
+        # Related only through marriage-like links (e.g. two parents of the same child)
+        return " of ".join(step["type"] for step in steps)
+
+    def name(self, person_id):
+        return self.names[self.index[person_id]]
+
+class KinshipService:
+    """
+    Builds and caches one KinshipGraph per user. Handlers that write relationships
+    or friendships call invalidate so the next query rebuilds the graph.
+    """
+
+    def __init__(self, pool, size=KINSHIP_CACHE_SIZE, ttl=KINSHIP_CACHE_TTL):
+        self.pool = pool
+        self.size = size
+        self.ttl = ttl
+        # user_id -> (expires, graph)
+        self._graphs = OrderedDict()
+        self._versions = {}
+        self._locks = {}
+
+    def invalidate(self, user_id=None):
+        """
+        Drop one user's graph, or every graph when user_id is not known. A graph holds
+        every person with their name and gender, so adding, deleting, renaming or
+        re-gendering a person makes it stale just like a relationship write.
+        """
+        if user_id is None:
+            for key in list(self._graphs):
+                self._drop(key)
+            for key in self._versions:
+                self._versions[key] += 1
+            return
+        # Graphs are keyed by the user_id query parameter; rows hand us a UUID. The
+        # graph of all users (key None) includes this user's people too
+        for key in (str(user_id), None):
+            self._drop(key)
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+    def _drop(self, key):
+        self._graphs.pop(key, None)
+        # A lock still held belongs to a build in progress, which the version bump
+        # already keeps out of the cache; the builder's next miss makes a new one
+        lock = self._locks.get(key)
+        if lock is not None and not lock.locked():
+            del self._locks[key]
+
+    def _cached(self, user_id):
+        entry = self._graphs.get(user_id)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            self._drop(user_id)
+            return None
+        self._graphs.move_to_end(user_id)
+        return entry[1]
+
+    async def graph(self, user_id):
+        graph = self._cached(user_id)
+        if graph is not None:
+            return graph
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            graph = self._cached(user_id)
+            if graph is not None:
+                return graph
+            version = self._versions.get(user_id, 0)
+            graph = await self._build(user_id)
+            # A write during the build makes this graph stale; use it once but do not keep it
+            if self._versions.get(user_id, 0) == version:
+                self._graphs[user_id] = (time.monotonic() + self.ttl, graph)
+                while len(self._graphs) > self.size:
+                    self._drop(next(iter(self._graphs)))
+            return graph
+
+    async def _build(self, user_id):
+        async with self.pool.acquire() as conn:
+            if user_id:
+                people = await conn.fetch('SELECT id, name, gender FROM people WHERE user_id = $1 ORDER BY id', user_id)
+                relationships = await conn.fetch('SELECT parent_id, child_id FROM relationships WHERE user_id = $1', user_id)
+                friendships = await conn.fetch('SELECT person1_id, person2_id FROM friendships WHERE user_id = $1', user_id)
+            else:
+                people = await conn.fetch('SELECT id, name, gender FROM people ORDER BY id')
+                relationships = await conn.fetch('SELECT parent_id, child_id FROM relationships')
+                friendships = await conn.fetch('SELECT person1_id, person2_id FROM friendships')
+        # Building is pure CPU work; keep it off the event loop
+        return await asyncio.to_thread(KinshipGraph, people, relationships, friendships)
+
+def get_kinship(request: Request) -> KinshipService:
+    return request.app.state.kinship
@@ -1,9 +1,65 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from appfolder.routes import stories, people, relationships, friendships  # <-- import the router
+from appfolder.routes import stories, people, relationships, friendships, media, transcription  # <-- import the router
+from appfolder.db import create_pool, DB_MIGRATE_ON_STARTUP
+from appfolder.ner import NERService, NER_MODEL, NER_WARMUP
+from appfolder.ner_cache import create_ner_cache
+from appfolder.kinship import KinshipService
+from appfolder.media import MediaService, MediaFiles
+from appfolder import upload_gc
+from appfolder.transcription import create_transcription_service
+from appfolder.response_cache import ResponseCache
+from appfolder.names import detect_trigram_matching
+from appfolder import migrations
 
-app = FastAPI()
+logger = logging.getLogger("uvicorn.error")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One connection pool for the whole app, shared by every router
+    started = time.perf_counter()
+    app.state.pool = await create_pool()
+    logger.info("Database pool ready in %.2fs", time.perf_counter() - started)
+    if DB_MIGRATE_ON_STARTUP:
+        async with app.state.pool.acquire() as conn:
+            applied = await migrations.apply(conn)
+        if applied:
+            logger.info("Applied migrations %s", ", ".join(applied))
+    # Fuzzy matching of detected names needs pg_trgm
+    await detect_trigram_matching(app.state.pool)
+    # spaCy runs in worker processes so parsing never blocks the event loop
+    app.state.ner = NERService(cache=await create_ner_cache(NER_MODEL, app.state.pool))
+    app.state.ner.start()
+    # Per-user relationship graphs, built on first use and dropped on writes
+    app.state.kinship = KinshipService(app.state.pool)
+    # Cached people/locations/relationships/friendships listings, dropped on writes
+    app.state.responses = ResponseCache()
+    # Thumbnails and avatar sizes of uploaded images
+    app.state.media = MediaService()
+    # Shared HTTP client for the speech-to-text provider
+    app.state.transcription = create_transcription_service()
+    # Optional periodic clean-up of uploads no story or person points to
+    gc_task = None
+    if upload_gc.UPLOAD_GC_INTERVAL_HOURS > 0:
+        gc_task = asyncio.create_task(upload_gc.run_periodically(app.state.pool))
+    if NER_WARMUP:
+        await app.state.ner.warm_up()
+    logger.info("Startup finished in %.2fs", time.perf_counter() - started)
+    try:
+        yield
+    finally:
+        if gc_task:
+            gc_task.cancel()
+        app.state.media.close()
+        await app.state.transcription.close()
+        await app.state.ner.stop()
+        await app.state.pool.close()
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow frontend to connect (Vite runs on port 5173)
 app.add_middleware(
@@ -14,13 +70,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mount static files for uploaded images
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# Mount static files for uploaded images; content-addressed files are cached as immutable
+app.mount("/uploads", MediaFiles(directory="uploads"), name="uploads")
 
 app.include_router(stories.router)
 app.include_router(people.router)
 app.include_router(relationships.router)
 app.include_router(friendships.router)
+app.include_router(media.router)
+app.include_router(transcription.router)
 
 @app.get("/")
 def read_root():
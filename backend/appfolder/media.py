@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import os
+import re
+import uuid
+from email.utils import parsedate
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from fastapi import Request
+from fastapi.responses import FileResponse
+from starlette.datastructures import Headers
+from starlette.staticfiles import StaticFiles, NotModifiedResponse
+from starlette.types import Scope
+from appfolder.storage import UPLOAD_DIR, BLOB_DIR
+
+# Derivative settings (override in appfolder/.env)
+MEDIA_WIDTHS = sorted(int(w) for w in os.getenv('MEDIA_WIDTHS', '64,128,256,1024').split(','))
+# 'webp' or 'jpeg'
+MEDIA_FORMAT = os.getenv('MEDIA_FORMAT', 'webp')
+MEDIA_QUALITY = int(os.getenv('MEDIA_QUALITY', '80'))
+MEDIA_WORKERS = int(os.getenv('MEDIA_WORKERS', '2'))
+
+DERIVED_DIR = UPLOAD_DIR / "derived"
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+# Blob (<sha256>.<ext>) or derivative (<sha256>_w<width>.<ext>) file names
+CONTENT_ADDRESSED_RE = re.compile(r'^([0-9a-f]{64}(?:_w\d+)?)(?:\.[a-z0-9]+)?$')
+# Content-addressed files never change, so browsers may keep them for a year without asking
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+FORMAT_EXTENSIONS = {'webp': '.webp', 'jpeg': '.jpg'}
+MEDIA_TYPES = {'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+
+logger = logging.getLogger("uvicorn.error")
+
+class UnsupportedImage(Exception):
+    """The blob is not an image Pillow can decode, or is too large to decode safely."""
+
+def find_blob(sha256: str):
+    """Original upload stored under this hash, whatever its extension, or None."""
+    if not SHA256_RE.match(sha256):
+        return None
+    shard = BLOB_DIR / sha256[:2] / sha256[2:4]
+    return next(iter(sorted(shard.glob(f"{sha256}*"))), None) if shard.is_dir() else None
+
+def blob_hash(path: Path):
+    """Hash part of a content-addressed blob path, or None for other uploads."""
+    sha256 = path.name.split('.', 1)[0]
+    return sha256 if SHA256_RE.match(sha256) else None
+
+def derivative_path(sha256: str, width: int, fmt: str = MEDIA_FORMAT) -> Path:
+    return DERIVED_DIR / sha256[:2] / sha256[2:4] / f"{sha256}_w{width}{FORMAT_EXTENSIONS[fmt]}"
+
+def snap_width(width: int) -> int:
+    """Smallest configured width that is at least `width`, so only a few sizes are ever made."""
+    for size in MEDIA_WIDTHS:
+        if size >= width:
+            return size
+    return MEDIA_WIDTHS[-1]
+
+def _locate(sha256: str, width: int, fmt: str):
+    """Blob and variant paths for this hash and width, and whether the variant exists yet."""
+    source = find_blob(sha256)
+    if source is None:
+        return None, None, False
+    target = derivative_path(sha256, width, fmt)
+    return source, target, target.exists()
+
+def _render(source: Path, target: Path, width: int, fmt: str, quality: int):
+    # Imported here so the API starts even before Pillow is needed
+    from PIL import Image, ImageOps, UnidentifiedImageError
+    try:
+        image = Image.open(source)
+    except (Image.DecompressionBombError, UnidentifiedImageError) as e:
+        raise UnsupportedImage(str(e)) from e
+    with image:
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            image.thumbnail((width, image.height * width // image.width or 1))
+        if fmt == 'jpeg' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temp name and rename so a half-written file is never served
+        tmp = target.with_name(f".{uuid.uuid4().hex}{target.suffix}")
+        image.save(tmp, format=fmt.upper(), quality=quality)
+        os.replace(tmp, target)
+
+class MediaService:
+    """
+    Generates resized WebP/JPEG variants of uploaded images in a thread pool
+    (Pillow releases the GIL while resizing). Variants are cached on disk under
+    uploads/derived, so each size of each blob is rendered once.
+    """
+
+    def __init__(self, workers=MEDIA_WORKERS, fmt=MEDIA_FORMAT, quality=MEDIA_QUALITY):
+        self.fmt = fmt
+        self.quality = quality
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="media")
+        self._pending = {}
+        self._tasks = set()
+
+    async def derivative(self, sha256: str, width: int):
+        """
+        Path of the variant for this hash and width, rendering it now if missing. None
+        if no such blob; raises UnsupportedImage if the blob cannot be decoded.
+        """
+        width = snap_width(width)
+        # Directory listing and stat stay off the event loop, like the render itself
+        loop = asyncio.get_running_loop()
+        source, target, exists = await loop.run_in_executor(self._executor, _locate, sha256, width, self.fmt)
+        if source is None:
+            return None
+        if exists:
+            return target
+        # Concurrent requests for the same variant share one render
+        key = (sha256, width)
+        if key not in self._pending:
+            loop = asyncio.get_running_loop()
+            self._pending[key] = loop.run_in_executor(self._executor, _render, source, target, width, self.fmt, self.quality)
+        try:
+            await asyncio.shield(self._pending[key])
+        finally:
+            if key in self._pending and self._pending[key].done():
+                del self._pending[key]
+        return target
+
+    def schedule(self, path: Path):
+        """Render every configured size of a freshly stored upload in the background."""
+        sha256 = blob_hash(path)
+        if sha256 is None:
+            return
+        task = asyncio.create_task(self._render_quietly(sha256))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _render_quietly(self, sha256):
+        # Sizes are rendered in turn so a blob that cannot be decoded is tried only once
+        for width in MEDIA_WIDTHS:
+            try:
+                await self.derivative(sha256, width)
+            except UnsupportedImage as e:
+                logger.info("Not rendering %s: %s", sha256, e)
+                return
+            except Exception:
+                logger.warning("Could not render %s at width %d", sha256, width, exc_info=True)
+
+    def media_type(self):
+        return MEDIA_TYPES[self.fmt]
+
+    def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+def is_not_modified(response_headers, request_headers) -> bool:
+    """Whether the client's If-None-Match / If-Modified-Since already covers this response."""
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match takes precedence over If-Modified-Since when both are sent
+        etag = response_headers.get("etag")
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return etag is not None and ("*" in tags or etag in [tag.removeprefix("W/") for tag in tags])
+    if_modified_since = parsedate(request_headers.get("if-modified-since") or "")
+    last_modified = parsedate(response_headers.get("last-modified") or "")
+    return if_modified_since is not None and last_modified is not None and if_modified_since >= last_modified
+
+def cache_file_response(path, scope: Scope, media_type=None, status_code=200, stat_result=None):
+    """
+    FileResponse with caching headers. Content-addressed files get a strong ETag
+    (their hash) and immutable Cache-Control; anything else must be revalidated.
+    Matching If-None-Match/If-Modified-Since gives a 304. Range requests are handled
+    by FileResponse itself.
+    """
+    response = FileResponse(path, status_code=status_code, media_type=media_type, stat_result=stat_result)
+    match = CONTENT_ADDRESSED_RE.match(Path(path).name)
+    if match:
+        response.headers["etag"] = f'"{match.group(1)}"'
+        response.headers["cache-control"] = IMMUTABLE_CACHE_CONTROL
+    else:
+        response.headers["cache-control"] = "no-cache"
+    request_headers = Headers(scope=scope)
+    if is_not_modified(response.headers, request_headers):
+        return NotModifiedResponse(response.headers)
+    return response
+
+class MediaFiles(StaticFiles):
+    """StaticFiles for /uploads with the caching rules of cache_file_response."""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        return cache_file_response(full_path, scope, status_code=status_code, stat_result=stat_result)
+
+def get_media(request: Request) -> MediaService:
+    return request.app.state.media
@@ -0,0 +1,31 @@
+-- Indexes for the queries every page makes. All lookups are scoped by user_id.
+
+-- GET /stories: WHERE user_id = $1 ORDER BY date DESC, id DESC, and its (date, id) cursor
+CREATE INDEX IF NOT EXISTS stories_user_date_id_idx ON stories (user_id, date, id);
+-- Stories mentioning a person: people_ids @> ARRAY[$1]
+CREATE INDEX IF NOT EXISTS stories_people_ids_idx ON stories USING GIN (people_ids);
+
+-- GET /people ordered by name, and name resolution when stories are saved
+CREATE INDEX IF NOT EXISTS people_user_name_idx ON people (user_id, name);
+CREATE INDEX IF NOT EXISTS locations_user_name_idx ON locations (user_id, name);
+
+-- One row per parent/child pair. Duplicates that slipped past the API check are dropped first.
+DELETE FROM relationships a
+USING relationships b
+WHERE a.ctid > b.ctid
+  AND a.user_id IS NOT DISTINCT FROM b.user_id
+  AND a.parent_id = b.parent_id
+  AND a.child_id = b.child_id;
+CREATE UNIQUE INDEX IF NOT EXISTS relationships_pair_key ON relationships (user_id, parent_id, child_id);
+-- Walking up the tree (ancestors, kinship) joins on child_id
+CREATE INDEX IF NOT EXISTS relationships_child_idx ON relationships (child_id);
+
+-- Friendships are symmetric, so the pair is stored in either order but indexed as (low, high)
+DELETE FROM friendships a
+USING friendships b
+WHERE a.ctid > b.ctid
+  AND a.user_id IS NOT DISTINCT FROM b.user_id
+  AND least(a.person1_id, a.person2_id) = least(b.person1_id, b.person2_id)
+  AND greatest(a.person1_id, a.person2_id) = greatest(b.person1_id, b.person2_id);
+CREATE UNIQUE INDEX IF NOT EXISTS friendships_pair_key
+    ON friendships (user_id, least(person1_id, person2_id), greatest(person1_id, person2_id));
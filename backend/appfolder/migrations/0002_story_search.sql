@@ -0,0 +1,7 @@
+-- Full-text search behind GET /stories/search. Title words weigh more than content.
+-- The 'english' configuration must match SEARCH_CONFIG in appfolder/search.py.
+ALTER TABLE stories ADD COLUMN IF NOT EXISTS search tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(content, '')), 'B')
+) STORED;
+CREATE INDEX IF NOT EXISTS stories_search_idx ON stories USING GIN (search);
@@ -0,0 +1,5 @@
+-- optional
+-- Fuzzy matching of detected names to existing people (appfolder/names.py). Where the
+-- role cannot create pg_trgm this revision is skipped and names are matched exactly.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS people_name_trgm_idx ON people USING GIN (name gin_trgm_ops);
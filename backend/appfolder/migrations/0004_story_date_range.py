@@ -0,0 +1,25 @@
+"""
+Typed date range for stories. stories.date stays the text the user wrote; date_start
+and date_end hold the days it covers ("summer 1962" -> 1962-06-01..1962-08-31) so the
+timeline can filter by an indexed range. Existing rows are backfilled in batches.
+"""
+from appfolder.dates import parse_date_range
+
+BATCH_SIZE = 1000
+
+async def upgrade(conn):
+    await conn.execute('ALTER TABLE stories ADD COLUMN IF NOT EXISTS date_start date, ADD COLUMN IF NOT EXISTS date_end date')
+    last_id = 0
+    while True:
+        rows = await conn.fetch('SELECT id, date FROM stories WHERE id > $1 ORDER BY id LIMIT $2', last_id, BATCH_SIZE)
+        if not rows:
+            break
+        ranges = [parse_date_range(row['date']) for row in rows]
+        await conn.execute('''
+            UPDATE stories s SET date_start = u.date_start, date_end = u.date_end
+            FROM unnest($1::int[], $2::date[], $3::date[]) AS u(id, date_start, date_end)
+            WHERE s.id = u.id
+        ''', [row['id'] for row in rows], [start for start, _ in ranges], [end for _, end in ranges])
+        last_id = rows[-1]['id']
+    # ?from=&to= filters on user_id, then date_start from both sides, then date_end
+    await conn.execute('CREATE INDEX IF NOT EXISTS stories_user_date_range_idx ON stories (user_id, date_start, date_end)')
@@ -0,0 +1,2 @@
+-- Name resolution looks people up by nickname: nicknames @> ARRAY[$2]
+CREATE INDEX IF NOT EXISTS people_nicknames_idx ON people USING GIN (nicknames);
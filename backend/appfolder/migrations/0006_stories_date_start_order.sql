@@ -0,0 +1,5 @@
+-- GET /stories and its cursor now order on the parsed date instead of the free-text one:
+-- WHERE user_id = $1 ORDER BY COALESCE(date_start, '-infinity') DESC, id DESC
+CREATE INDEX IF NOT EXISTS stories_user_date_start_id_idx
+    ON stories (user_id, COALESCE(date_start, '-infinity'::date) DESC, id DESC);
+DROP INDEX IF EXISTS stories_user_date_id_idx;
@@ -0,0 +1,118 @@
+"""
+Versioned schema changes. Each revision is a NNNN_name.sql file in this directory,
+or a NNNN_name.py file with `async def upgrade(conn)` for changes that need Python
+(e.g. backfilling parsed values). Revisions are applied once, in order, inside their
+own transaction and recorded in schema_migrations.
+
+A revision whose first line is `-- optional` (or `# optional` for Python) may fail,
+e.g. when the database role cannot create an extension. It is then left unrecorded,
+the revisions after it still run, and it is tried again on the next apply.
+"""
+import hashlib
+import importlib.util
+import logging
+import re
+import asyncpg
+from dataclasses import dataclass
+from pathlib import Path
+
+MIGRATIONS_DIR = Path(__file__).parent
+MIGRATION_FILE_RE = re.compile(r'^(\d{4})_(\w+)\.(sql|py)$')
+# pg_advisory_lock key, so two workers starting together do not migrate twice
+MIGRATION_LOCK_ID = 5_284_301
+
+logger = logging.getLogger("uvicorn.error")
+
+@dataclass
+class Migration:
+    version: str
+    name: str
+    path: Path
+
+    @property
+    def source(self):
+        return self.path.read_text(encoding='utf-8')
+
+    @property
+    def optional(self):
+        first_line = self.source.split('\n', 1)[0].strip()
+        return first_line in ('-- optional', '# optional')
+
+    @property
+    def checksum(self):
+        return hashlib.sha256(self.source.encode()).hexdigest()
+
+    async def run(self, conn):
+        if self.path.suffix == '.sql':
+            await conn.execute(self.source)
+            return
+        spec = importlib.util.spec_from_file_location(f"appfolder.migrations.m{self.version}", self.path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        await module.upgrade(conn)
+
+def discover():
+    migrations = []
+    for path in sorted(MIGRATIONS_DIR.iterdir()):
+        match = MIGRATION_FILE_RE.match(path.name)
+        if match:
+            migrations.append(Migration(match.group(1), match.group(2), path))
+    return migrations
+
+async def ensure_table(conn):
+    await conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version text PRIMARY KEY,
+            name text NOT NULL,
+            checksum text NOT NULL,
+            applied_at timestamptz NOT NULL DEFAULT now()
+        )
+    ''')
+
+async def status(conn):
+    """Every known revision with when it was applied and whether its file changed since."""
+    await ensure_table(conn)
+    applied = {row['version']: row for row in await conn.fetch('SELECT * FROM schema_migrations')}
+    result = []
+    for migration in discover():
+        row = applied.get(migration.version)
+        result.append({
+            "version": migration.version,
+            "name": migration.name,
+            "applied_at": row['applied_at'].isoformat() if row else None,
+            "modified": bool(row) and row['checksum'] != migration.checksum,
+        })
+    return result
+
+async def apply(conn, target=None):
+    """
+    Apply pending revisions up to and including `target` (all by default). Returns the
+    versions applied; optional revisions that failed are logged and skipped.
+    """
+    done = []
+    await conn.execute('SELECT pg_advisory_lock($1)', MIGRATION_LOCK_ID)
+    try:
+        await ensure_table(conn)
+        applied = {row['version'] for row in await conn.fetch('SELECT version FROM schema_migrations')}
+        for migration in discover():
+            if target is not None and migration.version > target:
+                break
+            if migration.version in applied:
+                continue
+            logger.info("Applying migration %s_%s", migration.version, migration.name)
+            try:
+                async with conn.transaction():
+                    await migration.run(conn)
+                    await conn.execute(
+                        'INSERT INTO schema_migrations (version, name, checksum) VALUES ($1, $2, $3)',
+                        migration.version, migration.name, migration.checksum
+                    )
+            except asyncpg.PostgresError:
+                if not migration.optional:
+                    raise
+                logger.warning("Skipped optional migration %s_%s", migration.version, migration.name, exc_info=True)
+                continue
+            done.append(migration.version)
+    finally:
+        await conn.execute('SELECT pg_advisory_unlock($1)', MIGRATION_LOCK_ID)
+    return done
@@ -0,0 +1,54 @@
+"""
+EXPLAIN checks that the hot queries can use the indexes the migrations create.
+Sequential scans are disabled for the check, so a small development database (where
+a seq scan would be cheaper) still shows whether an index is usable at all.
+"""
+import json
+from datetime import date
+from appfolder.routes.stories import story_select, STORY_ORDER
+from appfolder.search import SEARCH_CONFIG
+
+FRIEND_PAIR = 'least(person1_id, person2_id) = least($1::int, $2::int) AND greatest(person1_id, person2_id) = greatest($1::int, $2::int)'
+
+def index_checks(user_id):
+    """(endpoint, query, args, index the plan must use)."""
+    return [
+        ("GET /stories", story_select() + f' WHERE s.user_id = $1 ORDER BY {STORY_ORDER} DESC, s.id DESC LIMIT 51', [user_id], 'stories_user_date_start_id_idx'),
+        ("GET /people", 'SELECT * FROM people WHERE user_id = $1 ORDER BY name', [user_id], 'people_user_name_idx'),
+        ("GET /locations", 'SELECT * FROM locations WHERE user_id = $1 ORDER BY name', [user_id], 'locations_user_name_idx'),
+        ("GET /relationships", 'SELECT * FROM relationships WHERE user_id = $1', [user_id], 'relationships_pair_key'),
+        ("POST /friendships", f'SELECT * FROM friendships WHERE user_id = $3 AND {FRIEND_PAIR}', [1, 2, user_id], 'friendships_pair_key'),
+        ("GET /people/{id}/ancestors", 'SELECT parent_id FROM relationships WHERE child_id = $1', [1], 'relationships_child_idx'),
+        ("GET /stories?from=&to=", 'SELECT id FROM stories WHERE user_id = $1 AND date_end >= $2 AND date_start >= $3 AND date_start <= $4',
+         [user_id, date(1962, 1, 1), date(1952, 1, 1), date(1962, 12, 31)], 'stories_user_date_range_idx'),
+        ("stories of a person", 'SELECT id FROM stories WHERE people_ids @> ARRAY[$1::int]', [1], 'stories_people_ids_idx'),
+        ("GET /stories/search", f"SELECT id FROM stories WHERE search @@ websearch_to_tsquery('{SEARCH_CONFIG}', $1)", ['family'], 'stories_search_idx'),
+        ("name matching", 'SELECT id FROM people WHERE user_id = $1 AND name %> $2', [user_id, 'Joe'], 'people_name_trgm_idx'),
+        ("nickname matching", 'SELECT id FROM people WHERE user_id = $1 AND nicknames @> ARRAY[$2::text]', [user_id, 'Joe'], 'people_nicknames_idx'),
+    ]
+
+def plan_indexes(plan):
+    """Names of every index used anywhere in an EXPLAIN (FORMAT JSON) plan."""
+    found = set()
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        if 'Index Name' in node:
+            found.add(node['Index Name'])
+        stack.extend(node.get('Plans', []))
+    return found
+
+async def check_indexes(conn, user_id):
+    """Returns [{"endpoint", "index", "ok", "indexes_used"}] for every check."""
+    results = []
+    for endpoint, query, args, index in index_checks(user_id):
+        tr = conn.transaction()
+        await tr.start()
+        try:
+            await conn.execute('SET LOCAL enable_seqscan = off')
+            explained = await conn.fetchval('EXPLAIN (FORMAT JSON) ' + query, *args)
+        finally:
+            await tr.rollback()
+        used = plan_indexes(json.loads(explained)[0]['Plan'])
+        results.append({"endpoint": endpoint, "index": index, "ok": index in used, "indexes_used": sorted(used)})
+    return results
@@ -1,3 +1,4 @@
+import datetime
 from pydantic import BaseModel
 from typing import List, Optional
 
@@ -6,6 +7,9 @@ class Story(BaseModel):
     title: str
     content: str
     date: Optional[str] = None
+    # Days covered by date, e.g. "summer 1962" -> 1962-06-01..1962-08-31
+    date_start: Optional[datetime.date] = None
+    date_end: Optional[datetime.date] = None
     location_id: Optional[int] = None
     location_name: Optional[str] = None  # For serialization/display
     people_ids: List[int] = []
@@ -34,6 +38,14 @@ class LocationUpdate(BaseModel):
     location_id: Optional[int] = None
     location_name: Optional[str] = None
 
+class StoryUpdate(BaseModel):
+    # Fields left out are not changed
+    title: Optional[str] = None
+    date: Optional[str] = None
+    people_ids: Optional[List[int | str]] = None
+    location_id: Optional[int] = None
+    location_name: Optional[str] = None
+
 class Person(BaseModel):
     id: int
     name: str
@@ -63,6 +75,15 @@ class PersonUpdate(BaseModel):
 class NameUpdate(BaseModel):
     name: str
 
+class PersonPatch(BaseModel):
+    # Fields left out are not changed
+    name: Optional[str] = None
+    picture: Optional[str] = None
+    birth_date: Optional[str] = None
+    death_date: Optional[str] = None
+    gender: Optional[str] = None
+    nicknames: Optional[List[str]] = None
+
 class Relationship(BaseModel):
     parent_id: int
     child_id: int
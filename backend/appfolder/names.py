@@ -0,0 +1,36 @@
+import os
+
+# Fuzzy name matching settings (override in appfolder/.env)
+# Detected names at least this similar to an existing person are linked to them instead of creating a new person
+NAME_MATCH_THRESHOLD = float(os.getenv('NAME_MATCH_THRESHOLD', '0.8'))
+# ...and only when the best match scores at least this much above the next one, so
+# "Joe" is not linked to one of "Joe Smith" and "Joe Brown" at random
+NAME_MATCH_MARGIN = float(os.getenv('NAME_MATCH_MARGIN', '0.1'))
+# Lower bar for the candidates offered by GET /people/suggest
+NAME_SUGGEST_THRESHOLD = float(os.getenv('NAME_SUGGEST_THRESHOLD', '0.3'))
+NAME_SUGGEST_LIMIT = int(os.getenv('NAME_SUGGEST_LIMIT', '5'))
+
+# Set by detect_trigram_matching; without pg_trgm names are matched exactly
+trigram_matching = False
+
+async def detect_trigram_matching(pool):
+    """Turn fuzzy matching on when pg_trgm is installed (migrations/0003_people_name_trigrams.sql)."""
+    global trigram_matching
+    trigram_matching = bool(await pool.fetchval("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"))
+
+def name_variants(names):
+    """
+    Drop names whose words appear, in order, inside a longer name of the same batch
+    ("Joe" next to "Grandpa Joe"). Every word run of the kept names goes into one set,
+    so each name is checked with a lookup instead of against every other name.
+    """
+    by_length = sorted(set(names), key=lambda name: (-len(name.split()), name))
+    runs = set()
+    kept = []
+    for name in by_length:
+        words = tuple(word.lower() for word in name.split())
+        if not words or words in runs:
+            continue
+        kept.append(name)
+        runs.update(words[i:j] for i in range(len(words)) for j in range(i + 1, len(words) + 1))
+    return kept
@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException, Request
+
+# NER settings (override in appfolder/.env)
+NER_MODEL = os.getenv('NER_MODEL', 'en_core_web_sm')
+NER_WORKERS = int(os.getenv('NER_WORKERS', '2'))
+# Max texts sent to one worker in a single nlp.pipe call
+NER_BATCH_SIZE = int(os.getenv('NER_BATCH_SIZE', '16'))
+# How long the dispatcher waits for more texts to fill a batch
+NER_BATCH_WAIT_MS = float(os.getenv('NER_BATCH_WAIT_MS', '5'))
+# Texts waiting for a worker; requests beyond this get a 503
+NER_QUEUE_DEPTH = int(os.getenv('NER_QUEUE_DEPTH', '256'))
+# Pipeline components never loaded; only doc.ents is read, and ner in en_core_web_sm has its own tok2vec
+NER_EXCLUDE = [c.strip() for c in os.getenv('NER_EXCLUDE', 'tok2vec,tagger,parser,senter,attribute_ruler,lemmatizer').split(',') if c.strip()]
+# Load the model in every worker during startup instead of on the first request
+NER_WARMUP = os.getenv('NER_WARMUP', '0') == '1'
+
+logger = logging.getLogger("uvicorn.error")
+
+# --- Worker process side ---
+_nlp = None
+_load_seconds = None
+
+def _init_worker(model_name, exclude):
+    global _nlp, _load_seconds
+    started = time.perf_counter()
+    import spacy
+    _nlp = spacy.load(model_name, exclude=exclude)
+    _load_seconds = time.perf_counter() - started
+
+def _worker_stats():
+    # ru_maxrss is in kilobytes on Linux
+    return {
+        "pid": os.getpid(),
+        "load_seconds": _load_seconds,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "pipeline": _nlp.pipe_names,
+    }
+
+def _extract_batch(texts, batch_size):
+    return [
+        [{"text": ent.text, "label": ent.label_} for ent in doc.ents]
+        for doc in _nlp.pipe(texts, batch_size=batch_size)
+    ]
+
+# --- API process side ---
+class NERService:
+    """
+    Runs spaCy NER in a pool of worker processes so the event loop never parses text.
+    Texts queued by concurrent requests are grouped into batches for nlp.pipe; while
+    every worker is busy the queue keeps filling, so batches grow under load.
+    """
+
+    def __init__(self, model_name=NER_MODEL, workers=NER_WORKERS, batch_size=NER_BATCH_SIZE,
+                 batch_wait_ms=NER_BATCH_WAIT_MS, queue_depth=NER_QUEUE_DEPTH, exclude=NER_EXCLUDE, cache=None):
+        self.model_name = model_name
+        self.cache = cache
+        self.exclude = exclude
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait_ms / 1000
+        self.queue_depth = queue_depth
+        self._executor = None
+        self._queue = None
+        self._slots = None
+        self._dispatcher = None
+        self._batches = set()
+
+    def start(self):
+        # spawn rather than fork: forking a process that runs an event loop is unsafe.
+        # Workers are spawned on first use, so the model is not loaded until it is needed
+        # (or until warm_up is called).
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.model_name, self.exclude),
+        )
+        self._queue = asyncio.Queue(maxsize=self.queue_depth)
+        self._slots = asyncio.Semaphore(self.workers)
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def stop(self):
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        if self.cache:
+            await self.cache.close()
+
+    async def warm_up(self):
+        """Start every worker now and log how long the model took to load in each."""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        stats = await asyncio.gather(*(loop.run_in_executor(self._executor, _worker_stats) for _ in range(self.workers)))
+        for worker in {s["pid"]: s for s in stats}.values():
+            logger.info("NER worker %s loaded %s %s in %.2fs, max RSS %.0f MB",
+                        worker["pid"], self.model_name, worker["pipeline"], worker["load_seconds"], worker["max_rss_mb"])
+        logger.info("NER warm-up finished in %.2fs", time.perf_counter() - started)
+
+    async def extract(self, text: str) -> list:
+        """Entities for one text as [{"text": ..., "label": ...}]."""
+        if self.cache:
+            key = self.cache.key(text)
+            entities = await self.cache.get(key)
+            if entities is None:
+                entities = await self._parse(text)
+                await self.cache.put(key, entities)
+            return entities
+        return await self._parse(text)
+
+    async def _parse(self, text):
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((text, future))
+        except asyncio.QueueFull:
+            raise HTTPException(status_code=503, detail="Entity recognition is busy, try again")
+        return await future
+
+    async def extract_many(self, texts: list) -> list:
+        """
+        Entities for many texts, in order. Used for imports: uncached texts go straight
+        to the workers in batch_size chunks instead of through the request queue, and
+        each chunk takes a worker slot so interactive requests still get a turn.
+        """
+        results = [None] * len(texts)
+        keys = [None] * len(texts)
+        pending = []
+        for i, text in enumerate(texts):
+            if self.cache:
+                keys[i] = self.cache.key(text)
+                results[i] = await self.cache.get(keys[i])
+            if results[i] is None:
+                pending.append(i)
+        loop = asyncio.get_running_loop()
+
+        async def run_chunk(indexes):
+            async with self._slots:
+                chunk = await loop.run_in_executor(self._executor, _extract_batch, [texts[i] for i in indexes], self.batch_size)
+            for i, entities in zip(indexes, chunk):
+                results[i] = entities
+                if self.cache:
+                    await self.cache.put(keys[i], entities)
+
+        await asyncio.gather(*(run_chunk(pending[start:start + self.batch_size]) for start in range(0, len(pending), self.batch_size)))
+        return results
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._slots.acquire()
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            # Keep a reference so the running batch is not garbage collected
+            task = asyncio.create_task(self._run_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        texts = [text for text, _ in batch]
+        try:
+            results = await loop.run_in_executor(self._executor, _extract_batch, texts, self.batch_size)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future), entities in zip(batch, results):
+                if not future.done():
+                    future.set_result(entities)
+        finally:
+            self._slots.release()
+
+def get_ner(request: Request) -> NERService:
+    return request.app.state.ner
@@ -0,0 +1,154 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from importlib import metadata
+
+# Cache settings (override in appfolder/.env)
+NER_CACHE_SIZE = int(os.getenv('NER_CACHE_SIZE', '2048'))
+# Persistent tier: '' (memory only), 'sqlite' or 'postgres'
+NER_CACHE_STORE = os.getenv('NER_CACHE_STORE', '')
+NER_CACHE_SQLITE_PATH = os.getenv('NER_CACHE_SQLITE_PATH', 'ner_cache.sqlite3')
+
+logger = logging.getLogger("uvicorn.error")
+
+def model_version(model_name):
+    # The model is an installed package, so its version is known without loading it
+    try:
+        return metadata.version(model_name)
+    except metadata.PackageNotFoundError:
+        return 'unknown'
+
+def normalize_text(text):
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+class SQLiteStore:
+    def __init__(self, path):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute('CREATE TABLE IF NOT EXISTS ner_cache (key TEXT PRIMARY KEY, entities TEXT NOT NULL)')
+            self._db.commit()
+
+    def _get(self, key):
+        with self._lock:
+            row = self._db.execute('SELECT entities FROM ner_cache WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _put(self, key, entities):
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO ner_cache (key, entities) VALUES (?, ?)', (key, json.dumps(entities)))
+            self._db.commit()
+
+    async def get(self, key):
+        return await asyncio.to_thread(self._get, key)
+
+    async def put(self, key, entities):
+        await asyncio.to_thread(self._put, key, entities)
+
+    async def close(self):
+        self._db.close()
+
+class PostgresStore:
+    def __init__(self, pool):
+        self._pool = pool
+
+    async def setup(self):
+        await self._pool.execute(
+            'CREATE TABLE IF NOT EXISTS ner_cache (key text PRIMARY KEY, entities jsonb NOT NULL, created_at timestamptz NOT NULL DEFAULT now())'
+        )
+
+    async def get(self, key):
+        value = await self._pool.fetchval('SELECT entities::text FROM ner_cache WHERE key = $1', key)
+        return json.loads(value) if value is not None else None
+
+    async def put(self, key, entities):
+        await self._pool.execute(
+            'INSERT INTO ner_cache (key, entities) VALUES ($1, $2::jsonb) ON CONFLICT (key) DO NOTHING',
+            key, json.dumps(entities)
+        )
+
+    async def close(self):
+        pass
+
+class NERCache:
+    """
+    Entity results keyed by a hash of the normalized text and the model version,
+    so a story previewed through /ner is not parsed again when it is saved.
+    An in-memory LRU sits in front of an optional persistent store.
+    """
+
+    def __init__(self, model_name, size=NER_CACHE_SIZE, store=None):
+        self.version = f"{model_name}-{model_version(model_name)}"
+        self.size = size
+        self.store = store
+        self._entries = OrderedDict()
+        self.memory_hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.version}\0{normalize_text(text)}".encode()).hexdigest()
+
+    async def get(self, key):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.memory_hits += 1
+            return self._entries[key]
+        if self.store:
+            try:
+                entities = await self.store.get(key)
+            except Exception:
+                logger.warning("NER cache store read failed", exc_info=True)
+                entities = None
+            if entities is not None:
+                self.store_hits += 1
+                self._remember(key, entities)
+                return entities
+        self.misses += 1
+        return None
+
+    async def put(self, key, entities):
+        self._remember(key, entities)
+        if self.store:
+            try:
+                await self.store.put(key, entities)
+            except Exception:
+                logger.warning("NER cache store write failed", exc_info=True)
+
+    def _remember(self, key, entities):
+        self._entries[key] = entities
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.memory_hits + self.store_hits + self.misses
+        return {
+            "model": self.version,
+            "entries": len(self._entries),
+            "max_entries": self.size,
+            "store": NER_CACHE_STORE or None,
+            "memory_hits": self.memory_hits,
+            "store_hits": self.store_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.store_hits) / lookups if lookups else 0.0,
+        }
+
+    async def close(self):
+        if self.store:
+            await self.store.close()
+
+async def create_ner_cache(model_name, pool):
+    store = None
+    if NER_CACHE_STORE == 'sqlite':
+        store = SQLiteStore(NER_CACHE_SQLITE_PATH)
+    elif NER_CACHE_STORE == 'postgres':
+        store = PostgresStore(pool)
+        await store.setup()
+    return NERCache(model_name, store=store)
@@ -0,0 +1,83 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from appfolder.media import is_not_modified
+
+# Response cache settings (override in appfolder/.env)
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', '512'))
+# Upper bound on staleness for writes made outside this process (other workers, SQL console)
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '300'))
+# Browsers keep the body but must revalidate it with If-None-Match every time
+RESPONSE_CACHE_CONTROL = "private, no-cache"
+
+class ResponseCache:
+    """
+    Serialized JSON of list endpoints keyed by (route, user_id), with a strong ETag.
+    Each user has a version counter; handlers that write a user's people, locations,
+    relationships or friendships (or stories, which GET /people counts) call
+    invalidate, which makes that user's entries (and the unscoped, all-users
+    listings) stale.
+    """
+
+    def __init__(self, size=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._versions = {}
+        # Bumped by writes with no known user; invalidates everything
+        self._epoch = 0
+        # Bumped by every write; the version of listings not scoped to a user
+        self._any = 0
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, user_id):
+        if user_id is None:
+            return self._epoch, self._any
+        return self._epoch, self._versions.get(str(user_id), 0)
+
+    def invalidate(self, user_id=None):
+        if user_id is None:
+            self._epoch += 1
+        else:
+            key = str(user_id)
+            self._versions[key] = self._versions.get(key, 0) + 1
+        self._any += 1
+
+    async def respond(self, request: Request, route: str, user_id, load) -> Response:
+        """
+        Cached response for this route and user, calling `load()` for fresh data when
+        there is no current entry. A matching If-None-Match gives an empty 304.
+        """
+        key = (route, str(user_id) if user_id is not None else None)
+        version = self.version(user_id)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version and entry[1] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+        else:
+            self.misses += 1
+            body = JSONResponse(jsonable_encoder(await load())).body
+            etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+            entry = (version, time.monotonic() + self.ttl, etag, body)
+            # A write while loading means the data may already be stale; serve it but do not keep it
+            if self.version(user_id) == version:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+        _, _, etag, body = entry
+        headers = {"etag": etag, "cache-control": RESPONSE_CACHE_CONTROL}
+        if is_not_modified(headers, request.headers):
+            return Response(status_code=304, headers=headers)
+        return Response(body, media_type="application/json", headers=headers)
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+def get_response_cache(request: Request) -> ResponseCache:
+    return request.app.state.responses
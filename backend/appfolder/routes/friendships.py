@@ -1,14 +1,12 @@
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request, Depends
 from appfolder.models import Friendship, FriendshipIn
 import asyncpg
-import os
-from dotenv import load_dotenv
+from appfolder.db import get_conn, acquire
+from appfolder.kinship import KinshipService, get_kinship
+from appfolder.response_cache import ResponseCache, get_response_cache
 
 router = APIRouter()
 
-load_dotenv(dotenv_path='appfolder/.env')
-DATABASE_URL = os.getenv('SUPABASE_DB_URL')
-
 def serialize_row(row):
     d = dict(row)
     if 'user_id' in d and d['user_id'] is not None:
@@ -16,44 +14,50 @@ def serialize_row(row):
     return d
 
 @router.post("/friendships", response_model=Friendship)
-async def add_friendship(friendship_in: FriendshipIn):
-    conn = await asyncpg.connect(DATABASE_URL)
+async def add_friendship(friendship_in: FriendshipIn, conn: asyncpg.Connection = Depends(get_conn), kinship: KinshipService = Depends(get_kinship), responses: ResponseCache = Depends(get_response_cache)):
     person1 = await conn.fetchrow('SELECT * FROM people WHERE id = $1 AND user_id = $2', friendship_in.person1_id, friendship_in.user_id)
     person2 = await conn.fetchrow('SELECT * FROM people WHERE id = $1 AND user_id = $2', friendship_in.person2_id, friendship_in.user_id)
     if not person1 or not person2:
-        await conn.close()
         raise HTTPException(status_code=404, detail="One or both people not found")
-    existing = await conn.fetchrow('SELECT * FROM friendships WHERE ((person1_id = $1 AND person2_id = $2) OR (person1_id = $2 AND person2_id = $1)) AND user_id = $3', friendship_in.person1_id, friendship_in.person2_id, friendship_in.user_id)
+    # The pair is compared as (low, high) so friendships_pair_key serves the lookup in either order
+    existing = await conn.fetchrow('SELECT * FROM friendships WHERE user_id = $3 AND least(person1_id, person2_id) = least($1::int, $2::int) AND greatest(person1_id, person2_id) = greatest($1::int, $2::int)', friendship_in.person1_id, friendship_in.person2_id, friendship_in.user_id)
     if existing:
-        await conn.close()
         raise HTTPException(status_code=400, detail="Friendship already exists")
-    await conn.execute(
-        'INSERT INTO friendships (person1_id, person2_id, user_id) VALUES ($1, $2, $3)',
-        friendship_in.person1_id, friendship_in.person2_id, friendship_in.user_id
-    )
-    await conn.close()
+    try:
+        await conn.execute(
+            'INSERT INTO friendships (person1_id, person2_id, user_id) VALUES ($1, $2, $3)',
+            friendship_in.person1_id, friendship_in.person2_id, friendship_in.user_id
+        )
+    except asyncpg.UniqueViolationError:
+        raise HTTPException(status_code=400, detail="Friendship already exists")
+    kinship.invalidate(friendship_in.user_id)
+    responses.invalidate(friendship_in.user_id)
     return friendship_in
 
 @router.get("/friendships")
-async def get_friendships(request: Request):
+async def get_friendships(request: Request, responses: ResponseCache = Depends(get_response_cache)):
     user_id = request.query_params.get("user_id")
-    conn = await asyncpg.connect(DATABASE_URL)
-    if user_id:
-        rows = await conn.fetch('SELECT * FROM friendships WHERE user_id = $1', user_id)
-    else:
-        rows = await conn.fetch('SELECT * FROM friendships')
-    await conn.close()
-    return [serialize_row(row) for row in rows]
+
+    async def load():
+        # Only a cache miss takes a connection from the pool
+        async with acquire(request) as conn:
+            if user_id:
+                rows = await conn.fetch('SELECT * FROM friendships WHERE user_id = $1', user_id)
+            else:
+                rows = await conn.fetch('SELECT * FROM friendships')
+        return [serialize_row(row) for row in rows]
+
+    return await responses.respond(request, "friendships", user_id, load)
 
 @router.delete("/friendships")
-async def delete_friendship(person1_id: int, person2_id: int, request: Request):
+async def delete_friendship(person1_id: int, person2_id: int, request: Request, conn: asyncpg.Connection = Depends(get_conn), kinship: KinshipService = Depends(get_kinship), responses: ResponseCache = Depends(get_response_cache)):
     user_id = request.query_params.get("user_id")
-    conn = await asyncpg.connect(DATABASE_URL)
     if user_id:
-        result = await conn.execute('DELETE FROM friendships WHERE ((person1_id = $1 AND person2_id = $2) OR (person1_id = $2 AND person2_id = $1)) AND user_id = $3', person1_id, person2_id, user_id)
+        result = await conn.execute('DELETE FROM friendships WHERE user_id = $3 AND least(person1_id, person2_id) = least($1::int, $2::int) AND greatest(person1_id, person2_id) = greatest($1::int, $2::int)', person1_id, person2_id, user_id)
     else:
-        result = await conn.execute('DELETE FROM friendships WHERE (person1_id = $1 AND person2_id = $2) OR (person1_id = $2 AND person2_id = $1)', person1_id, person2_id)
-    await conn.close()
+        result = await conn.execute('DELETE FROM friendships WHERE least(person1_id, person2_id) = least($1::int, $2::int) AND greatest(person1_id, person2_id) = greatest($1::int, $2::int)', person1_id, person2_id)
+    kinship.invalidate(user_id)
+    responses.invalidate(user_id)
     if result == 'DELETE 1':
         return {"message": "Friendship deleted"}
     else:
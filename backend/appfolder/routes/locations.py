@@ -1,13 +1,10 @@
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request, Depends
 import asyncpg
-import os
-from dotenv import load_dotenv
+from appfolder.db import get_conn, acquire
+from appfolder.response_cache import ResponseCache, get_response_cache
 
 router = APIRouter()
 
-load_dotenv(dotenv_path='appfolder/.env')
-DATABASE_URL = os.getenv('SUPABASE_DB_URL')
-
 # --- Location helpers ---
 async def get_or_create_location(conn, name, user_id, picture=None):
     if not name:
@@ -18,6 +15,25 @@ async def get_or_create_location(conn, name, user_id, picture=None):
     new_row = await conn.fetchrow('INSERT INTO locations (name, user_id, picture) VALUES ($1, $2, $3) RETURNING id', name, user_id, picture)
     return new_row['id']
 
+async def resolve_locations(conn, names, user_id):
+    """Set-wise get_or_create_location: returns {name: id}, creating missing locations in one INSERT."""
+    names = list(dict.fromkeys(name for name in names if name))
+    if not names:
+        return {}
+    rows = await conn.fetch(
+        'SELECT DISTINCT ON (name) name, id FROM locations WHERE user_id = $1 AND name = ANY($2::text[]) ORDER BY name, id',
+        user_id, names
+    )
+    resolved = {row['name']: row['id'] for row in rows}
+    missing = [name for name in names if name not in resolved]
+    if missing:
+        rows = await conn.fetch(
+            'INSERT INTO locations (name, user_id) SELECT name, $1 FROM unnest($2::text[]) AS name RETURNING id, name',
+            user_id, missing
+        )
+        resolved.update({row['name']: row['id'] for row in rows})
+    return resolved
+
 async def get_location_name(conn, location_id):
     if not location_id:
         return None
@@ -25,28 +41,29 @@ async def get_location_name(conn, location_id):
     return row['name'] if row else None
 
 @router.get('/locations')
-async def get_locations(request: Request):
+async def get_locations(request: Request, responses: ResponseCache = Depends(get_response_cache)):
     user_id = request.query_params.get('user_id')
-    conn = await asyncpg.connect(DATABASE_URL)
-    if user_id:
-        rows = await conn.fetch('SELECT * FROM locations WHERE user_id = $1 ORDER BY name', user_id)
-    else:
-        rows = await conn.fetch('SELECT * FROM locations ORDER BY name')
-    await conn.close()
-    return [dict(row) for row in rows]
+
+    async def load():
+        # Only a cache miss takes a connection from the pool
+        async with acquire(request) as conn:
+            if user_id:
+                rows = await conn.fetch('SELECT * FROM locations WHERE user_id = $1 ORDER BY name', user_id)
+            else:
+                rows = await conn.fetch('SELECT * FROM locations ORDER BY name')
+        return [dict(row) for row in rows]
+
+    return await responses.respond(request, 'locations', user_id, load)
 
 @router.get('/locations/{location_id}')
-async def get_location(location_id: int):
-    conn = await asyncpg.connect(DATABASE_URL)
+async def get_location(location_id: int, conn: asyncpg.Connection = Depends(get_conn)):
     row = await conn.fetchrow('SELECT * FROM locations WHERE id = $1', location_id)
-    await conn.close()
     if row:
         return dict(row)
     raise HTTPException(status_code=404, detail='Location not found')
 
 @router.post('/locations')
-async def add_location(location: dict):
-    conn = await asyncpg.connect(DATABASE_URL)
+async def add_location(location: dict, conn: asyncpg.Connection = Depends(get_conn), responses: ResponseCache = Depends(get_response_cache)):
     row = await conn.fetchrow('INSERT INTO locations (name, user_id, picture) VALUES ($1, $2, $3) RETURNING *', location['name'], location['user_id'], location.get('picture'))
-    await conn.close()
+    responses.invalidate(row['user_id'])
     return dict(row) 
\ No newline at end of file
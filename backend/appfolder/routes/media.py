@@ -0,0 +1,22 @@
+from fastapi import APIRouter, HTTPException, Depends, Request
+from appfolder.media import MediaService, UnsupportedImage, get_media, cache_file_response
+
+router = APIRouter()
+
+@router.get("/media/{sha256}")
+async def get_media_file(sha256: str, request: Request, w: int = 256, media: MediaService = Depends(get_media)):
+    """
+    Resized variant of an uploaded image, e.g. /media/{hash}?w=64 for an avatar.
+    The width is rounded up to one of the configured sizes; missing sizes are
+    rendered on first request and served from disk afterwards, with an ETag and
+    immutable Cache-Control so browsers do not ask again.
+    """
+    if w < 1:
+        raise HTTPException(status_code=400, detail="Width must be positive")
+    try:
+        path = await media.derivative(sha256, w)
+    except (UnsupportedImage, OSError):
+        raise HTTPException(status_code=415, detail="File is not an image that can be resized")
+    if path is None:
+        raise HTTPException(status_code=404, detail="Media not found")
+    return cache_file_response(path, request.scope, media_type=media.media_type())
@@ -1,20 +1,20 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Request, Body
+from fastapi import APIRouter, HTTPException, UploadFile, File, Request, Body, Depends
 from fastapi import Path
-from appfolder.models import Person, PersonIn, PersonUpdate, NameUpdate
+from appfolder.models import Person, PersonIn, PersonUpdate, PersonPatch, NameUpdate
 from typing import Optional
-from pathlib import Path as PathLib
 import asyncpg
-import os
-import shutil
-from dotenv import load_dotenv
+from appfolder.db import get_conn, acquire
+from appfolder.storage import store_upload
+from appfolder.media import MediaService, get_media
+from appfolder.kinship import KinshipService, get_kinship
+from appfolder.response_cache import ResponseCache, get_response_cache
+from appfolder import names as name_matching
+from appfolder.names import NAME_MATCH_THRESHOLD, NAME_MATCH_MARGIN, NAME_SUGGEST_THRESHOLD, NAME_SUGGEST_LIMIT
 
 router = APIRouter()
 
-UPLOAD_DIR = PathLib("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
-
-load_dotenv(dotenv_path='appfolder/.env')
-DATABASE_URL = os.getenv('SUPABASE_DB_URL')
+# Deepest lineage the ancestors/descendants endpoints will walk
+LINEAGE_MAX_DEPTH = 50
 
 def serialize_row(row):
     d = dict(row)
@@ -22,192 +22,400 @@ def serialize_row(row):
         d['user_id'] = str(d['user_id'])
     return d
 
+# --- People name resolution ---
+async def lookup_people(conn, names, user_id):
+    """
+    Map names to existing people of one user in a single query. A name matches a
+    person's name first, then any of their nicknames. The two lookups are kept
+    apart so each uses its own index (people_user_name_idx, people_nicknames_idx).
+    Returns {name: id}.
+    """
+    rows = await conn.fetch('''
+        SELECT w.name, p.id
+        FROM unnest($2::text[]) AS w(name)
+        JOIN LATERAL (
+            (SELECT id, 0 AS by_nickname FROM people WHERE user_id = $1 AND name = w.name ORDER BY id LIMIT 1)
+            UNION ALL
+            (SELECT id, 1 AS by_nickname FROM people WHERE user_id = $1 AND nicknames @> ARRAY[w.name] ORDER BY id LIMIT 1)
+            ORDER BY by_nickname
+            LIMIT 1
+        ) p ON true
+    ''', user_id, names)
+    return {row['name']: row['id'] for row in rows}
+
+async def fuzzy_lookup_people(conn, names, user_id, threshold=NAME_MATCH_THRESHOLD, limit=1):
+    """
+    Existing people of one user whose name contains a word similar to each of the
+    given names, best first, using pg_trgm word similarity ("Joe" matches "Grandpa
+    Joe"). Only `name %> query` is filtered on, since that is the form the trigram
+    GIN index on people.name serves; the reverse similarity just breaks ties.
+    Returns {name: [{"id", "name", "score"}, ...]}.
+    """
+    if not name_matching.trigram_matching or not names:
+        return {}
+    async with conn.transaction():
+        # The %> operator compares against this setting, which keeps it indexable
+        await conn.execute("SELECT set_config('pg_trgm.word_similarity_threshold', $1, true)", str(threshold))
+        rows = await conn.fetch('''
+            SELECT w.name AS query, p.id, p.name, p.score
+            FROM unnest($2::text[]) AS w(name)
+            JOIN LATERAL (
+                SELECT id, name, word_similarity(w.name, name) AS score, word_similarity(name, w.name) AS reverse_score
+                FROM people
+                WHERE user_id = $1 AND name %> w.name
+                ORDER BY score DESC, reverse_score DESC, id
+                LIMIT $3
+            ) p ON true
+            ORDER BY w.name, p.score DESC, p.reverse_score DESC, p.id
+        ''', user_id, names, limit)
+    matches = {}
+    for row in rows:
+        matches.setdefault(row['query'], []).append({"id": row['id'], "name": row['name'], "score": round(row['score'], 3)})
+    return matches
+
+async def resolve_people(conn, names, user_id, fuzzy=()):
+    """
+    Resolve a batch of person names to ids, creating the missing people with one
+    multi-row INSERT. Names listed in `fuzzy` (e.g. detected by NER) that have no
+    exact match are linked to a similar existing person when exactly one clearly
+    stands out; ambiguous names create a new person as before.
+    Returns ({name: id} for every non-empty name given, [ids of people created]);
+    callers invalidate the user's kinship graph when the list is not empty.
+    """
+    names = list(dict.fromkeys(name for name in names if name))
+    created = []
+    if not names:
+        return {}, created
+    async with conn.transaction():
+        # Relatives may share a name, so people.name is not unique and ON CONFLICT has
+        # nothing to work with. Resolution is serialised per user instead, so two
+        # stories saved at once cannot both create "Joe"; the lock is held until the
+        # outermost transaction ends.
+        await conn.execute('SELECT pg_advisory_xact_lock(hashtext($1))', str(user_id))
+        resolved = await lookup_people(conn, names, user_id)
+        fuzzy = set(fuzzy)
+        approximate = [name for name in names if name not in resolved and name in fuzzy]
+        if approximate:
+            # The runner-up tells a clear match from a tie
+            for name, matches in (await fuzzy_lookup_people(conn, approximate, user_id, limit=2)).items():
+                if len(matches) == 1 or matches[0]["score"] - matches[1]["score"] >= NAME_MATCH_MARGIN:
+                    resolved[name] = matches[0]["id"]
+        missing = [name for name in names if name not in resolved]
+        if missing:
+            rows = await conn.fetch('''
+                INSERT INTO people (name, user_id, nicknames)
+                SELECT name, $1, '{}'::text[] FROM unnest($2::text[]) AS name
+                RETURNING id, name
+            ''', user_id, missing)
+            resolved.update({row['name']: row['id'] for row in rows})
+            created = [row['id'] for row in rows]
+    return resolved, created
+
+async def fetch_people(conn, user_id):
+    """
+    People ordered by name, each with story_count: how many stories mention them.
+    The counts come from one GROUP BY over the unnested people_ids of the same user's stories.
+    """
+    if user_id:
+        rows = await conn.fetch('''
+            SELECT p.*, COALESCE(c.story_count, 0) AS story_count
+            FROM people p
+            LEFT JOIN (
+                SELECT u.person_id, count(DISTINCT s.id) AS story_count
+                FROM stories s, unnest(s.people_ids) AS u(person_id)
+                WHERE s.user_id = $1
+                GROUP BY u.person_id
+            ) c ON c.person_id = p.id
+            WHERE p.user_id = $1
+            ORDER BY p.name
+        ''', user_id)
+    else:
+        rows = await conn.fetch('''
+            SELECT p.*, COALESCE(c.story_count, 0) AS story_count
+            FROM people p
+            LEFT JOIN (
+                SELECT u.person_id, count(DISTINCT s.id) AS story_count
+                FROM stories s, unnest(s.people_ids) AS u(person_id)
+                GROUP BY u.person_id
+            ) c ON c.person_id = p.id
+            ORDER BY p.name
+        ''')
+    return [serialize_row(row) for row in rows]
+
+# --- Lineage ---
+async def fetch_lineage(conn, person_id, user_id, direction, max_depth):
+    """
+    Ancestors (direction='ancestors') or descendants of a person in one WITH RECURSIVE
+    query over relationships. Each person comes back once with the generation they
+    were first reached at (1 = parents/children). UNION keeps one row per (id,
+    generation), so a person reached along many paths (cousin marriages) is not
+    multiplied at every step; the depth bound stops cycles.
+    """
+    if direction == 'ancestors':
+        join, step = 'r.child_id = l.id', 'r.parent_id'
+    else:
+        join, step = 'r.parent_id = l.id', 'r.child_id'
+    args = [person_id, max_depth]
+    user_filter = ''
+    if user_id:
+        args.append(user_id)
+        user_filter = 'AND r.user_id = $3'
+    rows = await conn.fetch(f'''
+        WITH RECURSIVE lineage(id, generation) AS (
+            SELECT $1::int, 0
+            UNION
+            SELECT {step}, l.generation + 1
+            FROM lineage l
+            JOIN relationships r ON {join} {user_filter}
+            WHERE l.generation < $2
+        )
+        SELECT p.id, p.name, p.picture, p.birth_date, p.death_date, p.gender, g.generation
+        FROM (SELECT id, MIN(generation) AS generation FROM lineage WHERE generation > 0 GROUP BY id) g
+        JOIN people p ON p.id = g.id
+        ORDER BY g.generation, p.name
+    ''', *args)
+    return [serialize_row(row) for row in rows]
+
+async def lineage_response(conn, person_id, user_id, direction, max_depth):
+    if max_depth < 1 or max_depth > LINEAGE_MAX_DEPTH:
+        raise HTTPException(status_code=400, detail=f"max_depth must be between 1 and {LINEAGE_MAX_DEPTH}")
+    if user_id:
+        exists = await conn.fetchval('SELECT 1 FROM people WHERE id = $1 AND user_id = $2', person_id, user_id)
+    else:
+        exists = await conn.fetchval('SELECT 1 FROM people WHERE id = $1', person_id)
+    if not exists:
+        raise HTTPException(status_code=404, detail="Person not found")
+    return {"person_id": person_id, direction: await fetch_lineage(conn, person_id, user_id, direction, max_depth)}
+
+@router.get("/people/{person_id}/ancestors")
+async def get_ancestors(person_id: int, request: Request, max_depth: int = 10, conn: asyncpg.Connection = Depends(get_conn)):
+    user_id = request.query_params.get("user_id")
+    return await lineage_response(conn, person_id, user_id, 'ancestors', max_depth)
+
+@router.get("/people/{person_id}/descendants")
+async def get_descendants(person_id: int, request: Request, max_depth: int = 10, conn: asyncpg.Connection = Depends(get_conn)):
+    user_id = request.query_params.get("user_id")
+    return await lineage_response(conn, person_id, user_id, 'descendants', max_depth)
+
+# --- Kinship ---
+@router.get("/people/{person_a}/path/{person_b}")
+async def get_path(person_a: int, person_b: int, request: Request, kinship: KinshipService = Depends(get_kinship)):
+    """Shortest chain of parent/child/friend links between two people."""
+    user_id = request.query_params.get("user_id")
+    graph = await kinship.graph(user_id)
+    if person_a not in graph or person_b not in graph:
+        raise HTTPException(status_code=404, detail="Person not found")
+    path = graph.shortest_path(person_a, person_b)
+    if path is None:
+        return {"path": None, "steps": [], "length": None}
+    return {
+        "path": [{"id": person_id, "name": graph.name(person_id)} for person_id in path],
+        "steps": graph.path_steps(path),
+        "length": len(path) - 1,
+    }
+
+@router.get("/people/{person_a}/kinship/{person_b}")
+async def get_kinship_label(person_a: int, person_b: int, request: Request, kinship: KinshipService = Depends(get_kinship)):
+    """How person_a is related to person_b, e.g. "second cousin once removed" or "friend of sister"."""
+    user_id = request.query_params.get("user_id")
+    graph = await kinship.graph(user_id)
+    if person_a not in graph or person_b not in graph:
+        raise HTTPException(status_code=404, detail="Person not found")
+    return {"person_a": person_a, "person_b": person_b, **graph.kinship(person_a, person_b)}
+
 @router.post("/people", response_model=Person)
-async def add_person(person_in: PersonIn):
-    conn = await asyncpg.connect(DATABASE_URL)
+async def add_person(person_in: PersonIn, conn: asyncpg.Connection = Depends(get_conn), kinship: KinshipService = Depends(get_kinship), responses: ResponseCache = Depends(get_response_cache)):
     row = await conn.fetchrow(
         'INSERT INTO people (name, picture, birth_date, death_date, gender, user_id, nicknames) VALUES ($1, $2, $3, $4, $5, $6, $7) RETURNING *',
         person_in.name, person_in.picture, person_in.birth_date, person_in.death_date, person_in.gender, person_in.user_id, person_in.nicknames
     )
-    await conn.close()
+    responses.invalidate(person_in.user_id)
+    kinship.invalidate(person_in.user_id)
     return serialize_row(row)
 
 @router.get("/people")
-async def get_people(request: Request):
+async def get_people(request: Request, responses: ResponseCache = Depends(get_response_cache)):
+    user_id = request.query_params.get("user_id")
+
+    async def load():
+        # Only a cache miss takes a connection from the pool
+        async with acquire(request) as conn:
+            return await fetch_people(conn, user_id)
+
+    return await responses.respond(request, "people", user_id, load)
+
+@router.get("/people/suggest")
+async def suggest_people(name: str, request: Request, limit: int = NAME_SUGGEST_LIMIT, conn: asyncpg.Connection = Depends(get_conn)):
+    """Existing people whose names look like `name`, best match first, for "did you mean" prompts."""
     user_id = request.query_params.get("user_id")
-    conn = await asyncpg.connect(DATABASE_URL)
+    if not name.strip():
+        raise HTTPException(status_code=400, detail="name is required")
+    limit = min(max(limit, 1), 50)
+    matches = await fuzzy_lookup_people(conn, [name], user_id, NAME_SUGGEST_THRESHOLD, limit)
+    return {"name": name, "suggestions": matches.get(name, [])}
+
+async def update_person(conn, person_id, user_id, fields):
+    """
+    Set the given person columns with a single UPDATE ... RETURNING and return the
+    updated row, or None if there is no such person (for this user). With no fields
+    the person is returned unchanged.
+    """
+    args = list(fields.values()) + [person_id]
+    where = f'id = ${len(args)}'
     if user_id:
-        rows = await conn.fetch('SELECT * FROM people WHERE user_id = $1 ORDER BY name', user_id)
+        args.append(user_id)
+        where += f' AND user_id = ${len(args)}'
+    if not fields:
+        return await conn.fetchrow(f'SELECT * FROM people WHERE {where}', *args)
+    sets = ', '.join(f'{column} = ${index}' for index, column in enumerate(fields, 1))
+    return await conn.fetchrow(f'UPDATE people SET {sets} WHERE {where} RETURNING *', *args)
+
+async def change_nickname(conn, person_id, nickname, add):
+    """
+    Add or remove one nickname in a single UPDATE ... RETURNING. The person is only
+    read again when nothing changed, to tell a missing person from a nickname that
+    was already there (add) or not there (remove).
+    """
+    if add:
+        row = await conn.fetchrow(
+            "UPDATE people SET nicknames = array_append(COALESCE(nicknames, '{}'), $1) WHERE id = $2 AND NOT $1 = ANY(COALESCE(nicknames, '{}')) RETURNING *",
+            nickname, person_id
+        )
     else:
-        rows = await conn.fetch('SELECT * FROM people ORDER BY name')
-    await conn.close()
-    return [serialize_row(row) for row in rows]
+        row = await conn.fetchrow(
+            "UPDATE people SET nicknames = array_remove(nicknames, $1) WHERE id = $2 AND $1 = ANY(nicknames) RETURNING *",
+            nickname, person_id
+        )
+    if row:
+        return row
+    if not await conn.fetchval('SELECT 1 FROM people WHERE id = $1', person_id):
+        raise HTTPException(status_code=404, detail="Person not found")
+    if add:
+        raise HTTPException(status_code=400, detail="Nickname already exists")
+    raise HTTPException(status_code=404, detail="Nickname not found")
 
-@router.get("/people/{person_id}")
-async def get_person(person_id: int, request: Request):
+@router.get("/people/{person_id:int}")
+async def get_person(person_id: int, request: Request, conn: asyncpg.Connection = Depends(get_conn)):
     user_id = request.query_params.get("user_id")
-    conn = await asyncpg.connect(DATABASE_URL)
     if user_id:
         row = await conn.fetchrow('SELECT * FROM people WHERE id = $1 AND user_id = $2', person_id, user_id)
     else:
         row = await conn.fetchrow('SELECT * FROM people WHERE id = $1', person_id)
-    await conn.close()
     if row:
         return serialize_row(row)
     raise HTTPException(status_code=404, detail="Person not found")
 
+@router.patch("/people/{person_id:int}", response_model=Person)
+async def patch_person(person_id: int, update: PersonPatch, request: Request, conn: asyncpg.Connection = Depends(get_conn), kinship: KinshipService = Depends(get_kinship), responses: ResponseCache = Depends(get_response_cache)):
+    """Update any subset of name, picture, birth_date, death_date, gender and nicknames; null clears a field."""
+    user_id = request.query_params.get("user_id")
+    fields = update.model_dump(exclude_unset=True)
+    if not fields:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    if 'name' in fields and not fields['name']:
+        raise HTTPException(status_code=400, detail="Name is required")
+    row = await update_person(conn, person_id, user_id, fields)
+    if not row:
+        raise HTTPException(status_code=404, detail="Person not found")
+    responses.invalidate(row['user_id'])
+    kinship.invalidate(row['user_id'])
+    return serialize_row(row)
+
 @router.patch("/people/{person_id}/picture", response_model=Person)
-async def update_person_picture(person_id: int, update: PersonUpdate, request: Request):
+async def update_person_picture(person_id: int, update: PersonUpdate, request: Request, conn: asyncpg.Connection = Depends(get_conn), kinship: KinshipService = Depends(get_kinship), responses: ResponseCache = Depends(get_response_cache)):
     user_id = request.query_params.get("user_id")
-    conn = await asyncpg.connect(DATABASE_URL)
-    if user_id:
-        row = await conn.fetchrow('SELECT * FROM people WHERE id = $1 AND user_id = $2', person_id, user_id)
-    else:
-        row = await conn.fetchrow('SELECT * FROM people WHERE id = $1', person_id)
+    # Fields sent as null keep their current value
+    row = await update_person(conn, person_id, user_id, update.model_dump(exclude_none=True))
     if not row:
-        await conn.close()
         raise HTTPException(status_code=404, detail="Person not found")
-    person = dict(row)
-    picture = update.picture if update.picture is not None else person.get('picture')
-    birth_date = update.birth_date if update.birth_date is not None else person.get('birth_date')
-    death_date = update.death_date if update.death_date is not None else person.get('death_date')
-    gender = update.gender if update.gender is not None else person.get('gender')
-    if user_id:
-        await conn.execute('UPDATE people SET picture = $1, birth_date = $2, death_date = $3, gender = $4 WHERE id = $5 AND user_id = $6', picture, birth_date, death_date, gender, person_id, user_id)
-    else:
-        await conn.execute('UPDATE people SET picture = $1, birth_date = $2, death_date = $3, gender = $4 WHERE id = $5', picture, birth_date, death_date, gender, person_id)
-    row = await conn.fetchrow('SELECT * FROM people WHERE id = $1', person_id)
-    await conn.close()
+    responses.invalidate(row['user_id'])
+    kinship.invalidate(row['user_id'])
     return serialize_row(row)
 
 @router.post("/people/{person_id}/upload-picture")
-async def upload_person_picture(person_id: int, request: Request, file: UploadFile = File(...)):
+async def upload_person_picture(person_id: int, request: Request, file: UploadFile = File(...), conn: asyncpg.Connection = Depends(get_conn), media: MediaService = Depends(get_media), responses: ResponseCache = Depends(get_response_cache)):
     user_id = request.query_params.get("user_id")
-    conn = await asyncpg.connect(DATABASE_URL)
     if user_id:
         row = await conn.fetchrow('SELECT * FROM people WHERE id = $1 AND user_id = $2', person_id, user_id)
     else:
         row = await conn.fetchrow('SELECT * FROM people WHERE id = $1', person_id)
     if not row:
-        await conn.close()
         raise HTTPException(status_code=404, detail="Person not found")
     # Validate file type
     if not file.content_type.startswith('image/'):
-        await conn.close()
         raise HTTPException(status_code=400, detail="File must be an image")
-    # Create filename
-    file_extension = file.filename.split('.')[-1]
-    normalized_input = row['name'].strip().lower().replace(' ', '_')
-    filename = f"{normalized_input}.{file_extension}"
-    file_path = UPLOAD_DIR / filename
-    # Save file
+    # Save file under its content hash (streamed, deduplicated)
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-    except Exception as e:
-        await conn.close()
+        stored = await store_upload(file)
+    except OSError as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
+    filename = stored.path.name
+    media.schedule(stored.path)
     # Update person's picture field in DB
-    url = f"/uploads/{filename}"
+    url = stored.url
     if user_id:
         await conn.execute('UPDATE people SET picture = $1 WHERE id = $2 AND user_id = $3', url, person_id, user_id)
     else:
         await conn.execute('UPDATE people SET picture = $1 WHERE id = $2', url, person_id)
-    await conn.close()
+    responses.invalidate(row['user_id'])
     return {"filename": filename, "url": url}
 
 @router.patch("/people/{person_id}/birth-date", response_model=Person)
-async def update_person_birth_date(person_id: int, request: Request, birth_date: Optional[str] = None):
+async def update_person_birth_date(person_id: int, request: Request, birth_date: Optional[str] = None, conn: asyncpg.Connection = Depends(get_conn), responses: ResponseCache = Depends(get_response_cache)):
     user_id = request.query_params.get("user_id")
-    conn = await asyncpg.connect(DATABASE_URL)
-    if user_id:
-        await conn.execute('UPDATE people SET birth_date = $1 WHERE id = $2 AND user_id = $3', birth_date, person_id, user_id)
-    else:
-        await conn.execute('UPDATE people SET birth_date = $1 WHERE id = $2', birth_date, person_id)
-    row = await conn.fetchrow('SELECT * FROM people WHERE id = $1', person_id)
-    await conn.close()
+    row = await update_person(conn, person_id, user_id, {'birth_date': birth_date})
     if row:
+        responses.invalidate(row['user_id'])
         return serialize_row(row)
     raise HTTPException(status_code=404, detail="Person not found")
 
 @router.patch("/people/{person_id}/death-date", response_model=Person)
-async def update_person_death_date(person_id: int, request: Request, death_date: Optional[str] = None):
+async def update_person_death_date(person_id: int, request: Request, death_date: Optional[str] = None, conn: asyncpg.Connection = Depends(get_conn), responses: ResponseCache = Depends(get_response_cache)):
     user_id = request.query_params.get("user_id")
-    conn = await asyncpg.connect(DATABASE_URL)
-    if user_id:
-        await conn.execute('UPDATE people SET death_date = $1 WHERE id = $2 AND user_id = $3', death_date, person_id, user_id)
-    else:
-        await conn.execute('UPDATE people SET death_date = $1 WHERE id = $2', death_date, person_id)
-    row = await conn.fetchrow('SELECT * FROM people WHERE id = $1', person_id)
-    await conn.close()
+    row = await update_person(conn, person_id, user_id, {'death_date': death_date})
     if row:
+        responses.invalidate(row['user_id'])
         return serialize_row(row)
     raise HTTPException(status_code=404, detail="Person not found")
 
 @router.patch("/people/{person_id}/gender", response_model=Person)
-async def update_person_gender(person_id: int, request: Request, gender: Optional[str] = None):
+async def update_person_gender(person_id: int, request: Request, gender: Optional[str] = None, conn: asyncpg.Connection = Depends(get_conn), kinship: KinshipService = Depends(get_kinship), responses: ResponseCache = Depends(get_response_cache)):
     user_id = request.query_params.get("user_id")
-    conn = await asyncpg.connect(DATABASE_URL)
-    if user_id:
-        await conn.execute('UPDATE people SET gender = $1 WHERE id = $2 AND user_id = $3', gender, person_id, user_id)
-    else:
-        await conn.execute('UPDATE people SET gender = $1 WHERE id = $2', gender, person_id)
-    row = await conn.fetchrow('SELECT * FROM people WHERE id = $1', person_id)
-    await conn.close()
+    row = await update_person(conn, person_id, user_id, {'gender': gender})
     if row:
+        responses.invalidate(row['user_id'])
+        kinship.invalidate(row['user_id'])
         return serialize_row(row)
     raise HTTPException(status_code=404, detail="Person not found")
 
 @router.post("/people/{person_id}/add-nickname")
-async def add_nickname(person_id: int, nickname: str = Body(..., embed=True)):
-    conn = await asyncpg.connect(DATABASE_URL)
-    person = await conn.fetchrow('SELECT * FROM people WHERE id = $1', person_id)
-    if not person:
-        await conn.close()
-        raise HTTPException(status_code=404, detail="Person not found")
-    nicknames = person['nicknames'] or []
-    if nickname in nicknames:
-        await conn.close()
-        raise HTTPException(status_code=400, detail="Nickname already exists")
-    nicknames.append(nickname)
-    await conn.execute('UPDATE people SET nicknames = $1 WHERE id = $2', nicknames, person_id)
-    updated = await conn.fetchrow('SELECT * FROM people WHERE id = $1', person_id)
-    await conn.close()
-    return serialize_row(updated)
+async def add_nickname(person_id: int, nickname: str = Body(..., embed=True), conn: asyncpg.Connection = Depends(get_conn), responses: ResponseCache = Depends(get_response_cache)):
+    row = await change_nickname(conn, person_id, nickname, add=True)
+    responses.invalidate(row['user_id'])
+    return serialize_row(row)
 
 @router.delete("/people/{person_id}/delete-nickname")
-async def delete_nickname(person_id: int, nickname: str = Body(..., embed=True)):
-    conn = await asyncpg.connect(DATABASE_URL)
-    person = await conn.fetchrow('SELECT * FROM people WHERE id = $1', person_id)
-    if not person:
-        await conn.close()
-        raise HTTPException(status_code=404, detail="Person not found")
-    nicknames = person['nicknames'] or []
-    if nickname not in nicknames:
-        await conn.close()
-        raise HTTPException(status_code=404, detail="Nickname not found")
-    nicknames = [n for n in nicknames if n != nickname]
-    await conn.execute('UPDATE people SET nicknames = $1 WHERE id = $2', nicknames, person_id)
-    updated = await conn.fetchrow('SELECT * FROM people WHERE id = $1', person_id)
-    await conn.close()
-    return serialize_row(updated)
+async def delete_nickname(person_id: int, nickname: str = Body(..., embed=True), conn: asyncpg.Connection = Depends(get_conn), responses: ResponseCache = Depends(get_response_cache)):
+    row = await change_nickname(conn, person_id, nickname, add=False)
+    responses.invalidate(row['user_id'])
+    return serialize_row(row)
 
 @router.delete("/people/{person_id}")
-async def delete_person(person_id: int):
-    conn = await asyncpg.connect(DATABASE_URL)
-    result = await conn.execute('DELETE FROM people WHERE id = $1', person_id)
-    await conn.close()
-    if result == 'DELETE 1':
+async def delete_person(person_id: int, conn: asyncpg.Connection = Depends(get_conn), kinship: KinshipService = Depends(get_kinship), responses: ResponseCache = Depends(get_response_cache)):
+    row = await conn.fetchrow('DELETE FROM people WHERE id = $1 RETURNING user_id', person_id)
+    if row:
+        responses.invalidate(row['user_id'])
+        kinship.invalidate(row['user_id'])
         return {"message": "Person deleted"}
     else:
         raise HTTPException(status_code=404, detail="Person not found")
 
 @router.patch("/people/{person_id}/name", response_model=Person)
-async def update_person_name(person_id: int, update: NameUpdate):
-    conn = await asyncpg.connect(DATABASE_URL)
-    await conn.execute('UPDATE people SET name = $1 WHERE id = $2', update.name, person_id)
-    row = await conn.fetchrow('SELECT * FROM people WHERE id = $1', person_id)
-    await conn.close()
+async def update_person_name(person_id: int, update: NameUpdate, request: Request, conn: asyncpg.Connection = Depends(get_conn), kinship: KinshipService = Depends(get_kinship), responses: ResponseCache = Depends(get_response_cache)):
+    user_id = request.query_params.get("user_id")
+    row = await update_person(conn, person_id, user_id, {'name': update.name})
     if row:
+        responses.invalidate(row['user_id'])
+        kinship.invalidate(row['user_id'])
         return serialize_row(row)
     raise HTTPException(status_code=404, detail="Person not found")
@@ -1,14 +1,12 @@
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request, Depends
 from appfolder.models import Relationship, RelationshipIn
 import asyncpg
-import os
-from dotenv import load_dotenv
+from appfolder.db import get_conn, acquire
+from appfolder.kinship import KinshipService, get_kinship
+from appfolder.response_cache import ResponseCache, get_response_cache
 
 router = APIRouter()
 
-load_dotenv(dotenv_path='appfolder/.env')
-DATABASE_URL = os.getenv('SUPABASE_DB_URL')
-
 def serialize_row(row):
     d = dict(row)
     if 'user_id' in d and d['user_id'] is not None:
@@ -16,44 +14,50 @@ def serialize_row(row):
     return d
 
 @router.post("/relationships", response_model=Relationship)
-async def add_relationship(relationship_in: RelationshipIn):
-    conn = await asyncpg.connect(DATABASE_URL)
+async def add_relationship(relationship_in: RelationshipIn, conn: asyncpg.Connection = Depends(get_conn), kinship: KinshipService = Depends(get_kinship), responses: ResponseCache = Depends(get_response_cache)):
     parent = await conn.fetchrow('SELECT * FROM people WHERE id = $1 AND user_id = $2', relationship_in.parent_id, relationship_in.user_id)
     child = await conn.fetchrow('SELECT * FROM people WHERE id = $1 AND user_id = $2', relationship_in.child_id, relationship_in.user_id)
     if not parent or not child:
-        await conn.close()
         raise HTTPException(status_code=404, detail="One or both people not found")
     existing = await conn.fetchrow('SELECT * FROM relationships WHERE parent_id = $1 AND child_id = $2 AND user_id = $3', relationship_in.parent_id, relationship_in.child_id, relationship_in.user_id)
     if existing:
-        await conn.close()
         raise HTTPException(status_code=400, detail="Relationship already exists")
-    await conn.execute(
-        'INSERT INTO relationships (parent_id, child_id, relationship_type, user_id) VALUES ($1, $2, $3, $4)',
-        relationship_in.parent_id, relationship_in.child_id, relationship_in.relationship_type, relationship_in.user_id
-    )
-    await conn.close()
+    try:
+        await conn.execute(
+            'INSERT INTO relationships (parent_id, child_id, relationship_type, user_id) VALUES ($1, $2, $3, $4)',
+            relationship_in.parent_id, relationship_in.child_id, relationship_in.relationship_type, relationship_in.user_id
+        )
+    except asyncpg.UniqueViolationError:
+        # Inserted concurrently since the check above (relationships_pair_key)
+        raise HTTPException(status_code=400, detail="Relationship already exists")
+    kinship.invalidate(relationship_in.user_id)
+    responses.invalidate(relationship_in.user_id)
     return relationship_in
 
 @router.get("/relationships")
-async def get_relationships(request: Request):
+async def get_relationships(request: Request, responses: ResponseCache = Depends(get_response_cache)):
     user_id = request.query_params.get("user_id")
-    conn = await asyncpg.connect(DATABASE_URL)
-    if user_id:
-        rows = await conn.fetch('SELECT * FROM relationships WHERE user_id = $1', user_id)
-    else:
-        rows = await conn.fetch('SELECT * FROM relationships')
-    await conn.close()
-    return [serialize_row(row) for row in rows]
+
+    async def load():
+        # Only a cache miss takes a connection from the pool
+        async with acquire(request) as conn:
+            if user_id:
+                rows = await conn.fetch('SELECT * FROM relationships WHERE user_id = $1', user_id)
+            else:
+                rows = await conn.fetch('SELECT * FROM relationships')
+        return [serialize_row(row) for row in rows]
+
+    return await responses.respond(request, "relationships", user_id, load)
 
 @router.delete("/relationships")
-async def delete_relationship(person1_id: int, person2_id: int, request: Request):
+async def delete_relationship(person1_id: int, person2_id: int, request: Request, conn: asyncpg.Connection = Depends(get_conn), kinship: KinshipService = Depends(get_kinship), responses: ResponseCache = Depends(get_response_cache)):
     user_id = request.query_params.get("user_id")
-    conn = await asyncpg.connect(DATABASE_URL)
     if user_id:
         result = await conn.execute('DELETE FROM relationships WHERE parent_id = $1 AND child_id = $2 AND user_id = $3', person1_id, person2_id, user_id)
     else:
         result = await conn.execute('DELETE FROM relationships WHERE parent_id = $1 AND child_id = $2', person1_id, person2_id)
-    await conn.close()
+    kinship.invalidate(user_id)
+    responses.invalidate(user_id)
     if result == 'DELETE 1':
         return {"message": "Relationship deleted"}
     else:
@@ -1,32 +1,56 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Request, Body
+from fastapi import APIRouter, HTTPException, UploadFile, File, Request, Body, Depends
 from fastapi import Path
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
 from typing import List
 from typing import Optional
 from datetime import datetime, date
 import os
-import shutil
-from pathlib import Path as PathLib
+import json
+import time
+import logging
 import asyncpg
-from dotenv import load_dotenv
-import spacy  # Add this import for spaCy
-from appfolder.models import Story, StoryIn, TitleUpdate, DateUpdate, PeopleUpdate, LocationUpdate, Person, PersonIn, PersonUpdate, NameUpdate, Relationship, RelationshipIn, Friendship, FriendshipIn
-from appfolder.utils import serialize_row, generate_title, generate_date, normalize_name
-from appfolder.routes.locations import router as locations_router, get_or_create_location, get_location_name
+from appfolder.models import Story, StoryIn, StoryUpdate, TitleUpdate, DateUpdate, PeopleUpdate, LocationUpdate, Relationship, RelationshipIn, Friendship, FriendshipIn
+from appfolder.db import get_conn, DB_POOL_ACQUIRE_TIMEOUT
+from appfolder.ner import NERService, get_ner
+from appfolder.storage import store_upload
+from appfolder.media import MediaService, get_media
+from appfolder.response_cache import ResponseCache, get_response_cache
+from appfolder.search import SEARCH_CONFIG, SNIPPET_OPTIONS, highlight
+from appfolder.names import name_variants
+from appfolder.dates import parse_date_range, window_bounds, earliest_overlapping_start
+from appfolder.utils import serialize_row, generate_title, generate_date, encode_cursor, decode_cursor
+from appfolder.routes.locations import router as locations_router, get_or_create_location, resolve_locations
+from appfolder.routes.people import resolve_people
+from appfolder.kinship import KinshipService, get_kinship
 
 router = APIRouter()
 router.include_router(locations_router)
 
-# Load spaCy model globally (load once at startup)
-nlp = spacy.load("en_core_web_sm")
-
-UPLOAD_DIR = PathLib("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
-
-load_dotenv(dotenv_path='appfolder/.env')
-DATABASE_URL = os.getenv('SUPABASE_DB_URL')
-print("DATABASE_URL", DATABASE_URL)
-print("CWD", os.getcwd())
+# Page sizes for GET /stories when paging with limit/cursor
+STORIES_PAGE_DEFAULT = 50
+STORIES_PAGE_MAX = 200
+# Rows fetched per round trip by the server-side cursor behind GET /stories/stream
+STORIES_STREAM_PREFETCH = 100
+# Largest import accepted by POST /stories/bulk
+STORIES_BULK_MAX = int(os.getenv('STORIES_BULK_MAX', '5000'))
+# Story summaries returned per bucket by GET /stories/aggregate
+STORIES_AGGREGATE_TOP_DEFAULT = 5
+STORIES_AGGREGATE_TOP_MAX = 50
+STORIES_AGGREGATE_EXCERPT_CHARS = 280
+# Bucket key of each ?by= grouping; stories without a parsed date or a location fall in the null bucket
+AGGREGATE_KEYS = {
+    'year': 'extract(year FROM s.date_start)::int',
+    'decade': '(extract(year FROM s.date_start)::int / 10) * 10',
+    'location': 's.location_id',
+}
+# date is the text as written; date_start/date_end are the days it covers (appfolder/dates.py)
+# Listings run newest first on the parsed start date, undated stories last. The same
+# expression is indexed (migrations/0006_stories_date_start_order.sql)
+STORY_ORDER = "COALESCE(s.date_start, '-infinity'::date)"
+STORY_COLUMNS = ['id', 'title', 'content', 'date', 'date_start', 'date_end', 'location_id', 'people_ids', 'photos', 'user_id']
+
+logger = logging.getLogger("uvicorn.error")
 
 # --- Location helpers ---
 # async def get_or_create_location(conn, name, user_id, picture=None):
@@ -72,278 +96,590 @@ print("CWD", os.getcwd())
 #     await conn.close()
 #     return dict(row)
 
-async def get_people_names(conn, people_ids):
-    if not people_ids:
-        return []
-    rows = await conn.fetch('SELECT id, name FROM people WHERE id = ANY($1)', people_ids)
-    id_to_name = {row['id']: row['name'] for row in rows}
-    return [id_to_name.get(pid, str(pid)) for pid in people_ids]
+def story_select(source="stories"):
+    """
+    SELECT that returns story rows from `source` (a table or CTE name) with
+    location_name and people_names attached in one query. people_names keeps
+    the order of people_ids; unknown ids fall back to the id as text.
+    """
+    # Columns are listed so the generated search vector is never sent to clients
+    columns = ', '.join(f's.{column}' for column in STORY_COLUMNS)
+    return f'''
+        SELECT {columns},
+               l.name AS location_name,
+               COALESCE(pn.people_names, '{{}}') AS people_names
+        FROM {source} s
+        LEFT JOIN locations l ON l.id = s.location_id
+        LEFT JOIN LATERAL (
+            SELECT array_agg(COALESCE(p.name, u.person_id::text) ORDER BY u.ord) AS people_names
+            FROM unnest(s.people_ids) WITH ORDINALITY AS u(person_id, ord)
+            LEFT JOIN people p ON p.id = u.person_id
+        ) pn ON true
+    '''
+
+def page_limit(limit):
+    """Requested page size, or the default, kept within 1..STORIES_PAGE_MAX."""
+    return min(max(limit or STORIES_PAGE_DEFAULT, 1), STORIES_PAGE_MAX)
+
+def read_cursor(cursor, *types):
+    """Values of a cursor issued by next_page, each converted by its type; 400 if it is not one."""
+    try:
+        values = decode_cursor(cursor)
+        if len(values) != len(types):
+            raise ValueError("Invalid cursor")
+        return [convert(value) for convert, value in zip(types, values)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def cursor_date(value):
+    # An undated last row has a null date_start
+    return date.fromisoformat(value) if value is not None else None
+
+def next_page(rows, limit, *keys):
+    """
+    Split the `limit + 1` rows fetched for a page into the page itself and the cursor
+    for the next one, made from the `keys` of the page's last row (None on the last page).
+    """
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        return rows[:limit], encode_cursor(*(last[key] for key in keys))
+    return rows, None
+
+def stories_where(user_id, cursor, person_id=None, window=(None, None)):
+    """
+    WHERE clause and args for the story listing. Stories are ordered newest first
+    on (STORY_ORDER, id), so a cursor holding the last row's (date_start, id)
+    continues after it; an undated last row has a null date_start.
+    With person_id only stories mentioning that person are kept; with a (start, end)
+    window only stories whose date range overlaps it.
+    """
+    conditions = []
+    args = []
+    if user_id:
+        args.append(user_id)
+        conditions.append(f's.user_id = ${len(args)}')
+    if person_id is not None:
+        # Containment rather than = ANY so the GIN index on people_ids applies
+        args.append(person_id)
+        conditions.append(f's.people_ids @> ARRAY[${len(args)}::int]')
+    start, end = window
+    if start is not None:
+        # No story spans more than a decade, so date_start is bounded from below too
+        # and the (user_id, date_start, date_end) index is read as a narrow range
+        args += [start, earliest_overlapping_start(start)]
+        conditions.append(f's.date_end >= ${len(args) - 1} AND s.date_start >= ${len(args)}')
+    if end is not None:
+        args.append(end)
+        conditions.append(f's.date_start <= ${len(args)}')
+    if cursor:
+        date_value, story_id = read_cursor(cursor, cursor_date, int)
+        # A null date_start stands for the -infinity undated stories sort as
+        args += [date_value, story_id]
+        conditions.append(f"({STORY_ORDER}, s.id) < (COALESCE(${len(args) - 1}::date, '-infinity'::date), ${len(args)})")
+    where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+    return where, args
+
+def date_window(request: Request):
+    # "from" is a Python keyword, so the window is read from the query string directly
+    try:
+        return window_bounds(request.query_params.get("from"), request.query_params.get("to"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/stories")
-async def get_stories(request: Request):
+async def get_stories(request: Request, limit: Optional[int] = None, cursor: Optional[str] = None, conn: asyncpg.Connection = Depends(get_conn)):
+    """
+    Without limit/cursor returns every story as a list (legacy behaviour).
+    With limit and/or cursor returns {"stories": [...], "next_cursor": ...};
+    pass next_cursor back to get the following page, it is null on the last page.
+    ?from=&to= keep stories whose dates overlap the window; both take the same
+    forms as story dates ("1962-06-01", "1950s", "summer 1962").
+    """
+    user_id = request.query_params.get("user_id")
+    where, args = stories_where(user_id, cursor, window=date_window(request))
+    if limit is None and cursor is None:
+        rows = await conn.fetch(story_select() + where + f' ORDER BY {STORY_ORDER} DESC, s.id DESC', *args)
+        return [serialize_row(row) for row in rows]
+    limit = page_limit(limit)
+    # One extra row tells us whether there is another page
+    args.append(limit + 1)
+    rows = await conn.fetch(story_select() + where + f' ORDER BY {STORY_ORDER} DESC, s.id DESC LIMIT ${len(args)}', *args)
+    rows, next_cursor = next_page(rows, limit, 'date_start', 'id')
+    return {"stories": [serialize_row(row) for row in rows], "next_cursor": next_cursor}
+
+@router.get("/people/{person_id}/stories")
+async def get_person_stories(person_id: int, request: Request, limit: Optional[int] = None, cursor: Optional[str] = None, conn: asyncpg.Connection = Depends(get_conn)):
+    """Stories that mention a person, newest first, one page at a time: {"person_id", "stories", "next_cursor"}."""
     user_id = request.query_params.get("user_id")
-    conn = await asyncpg.connect(DATABASE_URL)
     if user_id:
-        rows = await conn.fetch('SELECT * FROM stories WHERE user_id = $1 ORDER BY date DESC', user_id)
+        exists = await conn.fetchval('SELECT 1 FROM people WHERE id = $1 AND user_id = $2', person_id, user_id)
     else:
-        rows = await conn.fetch('SELECT * FROM stories ORDER BY date DESC')
-    # Attach people_names and location_name for each story
+        exists = await conn.fetchval('SELECT 1 FROM people WHERE id = $1', person_id)
+    if not exists:
+        raise HTTPException(status_code=404, detail="Person not found")
+    where, args = stories_where(user_id, cursor, person_id)
+    limit = page_limit(limit)
+    args.append(limit + 1)
+    rows = await conn.fetch(story_select() + where + f' ORDER BY {STORY_ORDER} DESC, s.id DESC LIMIT ${len(args)}', *args)
+    rows, next_cursor = next_page(rows, limit, 'date_start', 'id')
+    return {"person_id": person_id, "stories": [serialize_row(row) for row in rows], "next_cursor": next_cursor}
+
+@router.get("/stories/stream")
+async def stream_stories(request: Request, cursor: Optional[str] = None):
+    """
+    Streams stories as NDJSON (one story per line), newest first, read through a
+    server-side cursor so memory use does not grow with the size of the archive.
+    Takes the same ?from=&to= window as GET /stories.
+    """
+    user_id = request.query_params.get("user_id")
+    where, args = stories_where(user_id, cursor, window=date_window(request))
+    query = story_select() + where + f' ORDER BY {STORY_ORDER} DESC, s.id DESC'
+    pool = request.app.state.pool
+
+    async def rows_as_ndjson():
+        # The connection is held for as long as the response streams, so it is
+        # taken from the pool here rather than through get_conn
+        async with pool.acquire(timeout=DB_POOL_ACQUIRE_TIMEOUT) as conn:
+            async with conn.transaction(readonly=True):
+                async for row in conn.cursor(query, *args, prefetch=STORIES_STREAM_PREFETCH):
+                    yield json.dumps(serialize_row(row), default=str) + "\n"
+
+    return StreamingResponse(rows_as_ndjson(), media_type="application/x-ndjson")
+
+@router.get("/stories/search")
+async def search_stories(request: Request, q: str = '', limit: Optional[int] = None, cursor: Optional[str] = None, conn: asyncpg.Connection = Depends(get_conn)):
+    """
+    Full-text search over story titles and content through the GIN-indexed search
+    column. q takes web-search syntax ("quoted phrases", or, -exclude). Results are
+    ranked with ts_rank (title matches count more) and carry an HTML snippet with
+    the matches in <mark>. Returns {"stories": [...], "next_cursor": ...}.
+    """
+    user_id = request.query_params.get("user_id")
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="q is required")
+    limit = page_limit(limit)
+    args = [q]
+    conditions = ['s.search @@ q.query']
+    if user_id:
+        args.append(user_id)
+        conditions.append(f's.user_id = ${len(args)}')
+    if cursor:
+        args += read_cursor(cursor, float, int)
+        conditions.append(f'(ts_rank(s.search, q.query), s.id) < (${len(args) - 1}::real, ${len(args)})')
+    args.append(limit + 1)
+    # Only the rows of this page are passed to ts_headline, which is the expensive part
+    rows = await conn.fetch(f'''
+        WITH q AS (SELECT websearch_to_tsquery('{SEARCH_CONFIG}', $1) AS query),
+        page AS (
+            SELECT s.*, ts_rank(s.search, q.query) AS rank
+            FROM stories s, q
+            WHERE {' AND '.join(conditions)}
+            ORDER BY rank DESC, s.id DESC
+            LIMIT ${len(args)}
+        ),
+        found AS ({story_select('page')})
+        SELECT found.*, page.rank,
+               ts_headline('{SEARCH_CONFIG}', page.content, q.query, ${len(args) + 1}) AS snippet
+        FROM found JOIN page ON page.id = found.id, q
+        ORDER BY page.rank DESC, page.id DESC
+    ''', *args, SNIPPET_OPTIONS)
+    rows, next_cursor = next_page(rows, limit, 'rank', 'id')
     stories = []
     for row in rows:
         story = serialize_row(row)
-        story["location_name"] = await get_location_name(conn, story.get("location_id")) if story.get("location_id") else None
-        story["people_names"] = await get_people_names(conn, story.get("people_ids") or [])
+        story['snippet'] = highlight(story['snippet'])
         stories.append(story)
-    await conn.close()
-    return stories
+    return {"stories": stories, "next_cursor": next_cursor}
+
+@router.get("/stories/aggregate")
+async def aggregate_stories(request: Request, by: str = 'year', top: Optional[int] = None, conn: asyncpg.Connection = Depends(get_conn)):
+    """
+    Stories grouped by year, decade or location in one GROUP BY: each bucket has its
+    key, a label, the story count and summaries (id, title, date, location_id,
+    people_ids and the start of the content as excerpt) of its newest `top` stories. Years and decades come from date_start,
+    newest bucket first; locations are ordered by story count, with the null bucket
+    last either way. Takes the same ?from=&to= window as GET /stories.
+    """
+    user_id = request.query_params.get("user_id")
+    if by not in AGGREGATE_KEYS:
+        raise HTTPException(status_code=400, detail=f"by must be one of {', '.join(AGGREGATE_KEYS)}")
+    top = min(max(top or STORIES_AGGREGATE_TOP_DEFAULT, 1), STORIES_AGGREGATE_TOP_MAX)
+    where, args = stories_where(user_id, None, window=date_window(request))
+    args.append(top)
+    key = AGGREGATE_KEYS[by]
+    order = 'key IS NULL, count DESC, location_name' if by == 'location' else 'key DESC NULLS LAST'
+    # row_number picks each bucket's newest stories, so only those are built into summaries
+    rows = await conn.fetch(f'''
+        SELECT key, count(*) AS count, min(location_name) AS location_name,
+               jsonb_agg(jsonb_build_object(
+                   'id', id, 'title', title, 'date', date, 'location_id', location_id, 'people_ids', people_ids,
+                   'excerpt', left(content, {STORIES_AGGREGATE_EXCERPT_CHARS})
+               ) ORDER BY rank) FILTER (WHERE rank <= ${len(args)}) AS stories
+        FROM (
+            SELECT {key} AS key, s.id, s.title, s.content, s.date, s.location_id, s.people_ids, l.name AS location_name,
+                   row_number() OVER (PARTITION BY {key} ORDER BY {STORY_ORDER} DESC, s.id DESC) AS rank
+            FROM stories s
+            LEFT JOIN locations l ON l.id = s.location_id
+            {where}
+        ) ranked
+        GROUP BY key
+        ORDER BY {order}
+    ''', *args)
+    buckets = []
+    for row in rows:
+        if row['key'] is None:
+            label = None
+        elif by == 'location':
+            label = row['location_name']
+        elif by == 'decade':
+            label = f"{row['key']}s"
+        else:
+            label = str(row['key'])
+        buckets.append({"key": row['key'], "label": label, "count": row['count'], "stories": json.loads(row['stories'])})
+    return {"by": by, "buckets": buckets}
+
+def people_from_entities(entities):
+    """PERSON entity names, dropping names contained in a longer detected name."""
+    return name_variants(ent["text"].strip() for ent in entities if ent["label"] == "PERSON")
+
+async def read_bulk_items(request: Request):
+    """
+    Items of a bulk import body: a JSON array, or NDJSON (one object per line) when
+    the content type is application/x-ndjson. Lines that are not valid JSON come back
+    as ValueError so they can be reported per item.
+    """
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        items = []
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            items += [line for line in lines if line.strip()]
+        if buffer.strip():
+            items.append(buffer)
+        parsed = []
+        for line in items:
+            try:
+                parsed.append(json.loads(line))
+            except ValueError as e:
+                parsed.append(ValueError(f"Invalid JSON: {e}"))
+        return parsed
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+    if not isinstance(body, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+    return body
+
+@router.post("/stories/bulk")
+async def bulk_add_stories(request: Request, conn: asyncpg.Connection = Depends(get_conn), ner: NERService = Depends(get_ner), responses: ResponseCache = Depends(get_response_cache), kinship: KinshipService = Depends(get_kinship)):
+    """
+    Import many stories at once. Accepts a JSON array or an NDJSON stream of StoryIn.
+    NER runs in batches, people and locations are resolved set-wise per user, and the
+    stories are loaded with COPY in one transaction. Returns a result per item plus
+    the import throughput.
+    """
+    started = time.perf_counter()
+    items = await read_bulk_items(request)
+    if len(items) > STORIES_BULK_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {STORIES_BULK_MAX} stories per import")
+    results = [None] * len(items)
+    stories = []
+    for index, item in enumerate(items):
+        if isinstance(item, ValueError):
+            results[index] = {"index": index, "status": "error", "detail": str(item)}
+            continue
+        try:
+            stories.append((index, StoryIn.model_validate(item)))
+        except ValidationError as e:
+            results[index] = {"index": index, "status": "error", "detail": e.errors(include_url=False, include_context=False)}
+
+    if stories:
+        all_entities = await ner.extract_many([story_in.content for _, story_in in stories])
+        detected_names = [people_from_entities(entities) for entities in all_entities]
+        # Names given explicitly plus names detected by NER, per story
+        story_names = [
+            [val for val in story_in.people_ids if isinstance(val, str)] + sorted(detected)
+            for (_, story_in), detected in zip(stories, detected_names)
+        ]
+        async with conn.transaction():
+            # Resolve people and locations for each user in one pass. Users are taken in a
+            # fixed order so concurrent imports acquire resolve_people's locks alike
+            person_ids = {}
+            location_ids = {}
+            new_people = set()
+            for user_id in sorted(set(story_in.user_id for _, story_in in stories)):
+                user_stories = [(story_in, names) for (_, story_in), names in zip(stories, story_names) if story_in.user_id == user_id]
+                names = [name for _, names in user_stories for name in names]
+                detected = [name for (_, story_in), found in zip(stories, detected_names) if story_in.user_id == user_id for name in found]
+                resolved, created = await resolve_people(conn, names, user_id, fuzzy=detected)
+                for name, person_id in resolved.items():
+                    person_ids[(user_id, name)] = person_id
+                if created:
+                    new_people.add(user_id)
+                location_names = [story_in.location_name for story_in, _ in user_stories if not story_in.location_id]
+                for name, location_id in (await resolve_locations(conn, location_names, user_id)).items():
+                    location_ids[(user_id, name)] = location_id
+            # Ids are reserved up front because COPY cannot return them
+            id_rows = await conn.fetch(
+                "SELECT nextval(pg_get_serial_sequence('stories', 'id')) AS id FROM generate_series(1, $1)",
+                len(stories)
+            )
+            records = []
+            for (index, story_in), names, id_row in zip(stories, story_names, id_rows):
+                people_ids = set(val for val in story_in.people_ids if isinstance(val, int))
+                people_ids.update(person_ids[(story_in.user_id, name)] for name in names if name)
+                location_id = story_in.location_id or location_ids.get((story_in.user_id, story_in.location_name))
+                title = generate_title(story_in.content)
+                date_value = story_in.date if story_in.date else datetime.now().strftime("%Y-%m-%d")
+                date_start, date_end = parse_date_range(date_value)
+                records.append((id_row['id'], title, story_in.content, date_value, date_start, date_end, location_id, list(people_ids), story_in.photos, story_in.user_id))
+                results[index] = {"index": index, "status": "created", "id": id_row['id'], "title": title}
+            await conn.copy_records_to_table('stories', records=records, columns=STORY_COLUMNS)
+        # New people and locations, and new story counts, for any of these users
+        for user_id in set(story_in.user_id for _, story_in in stories):
+            responses.invalidate(user_id)
+        for user_id in new_people:
+            kinship.invalidate(user_id)
+
+    seconds = time.perf_counter() - started
+    created = len(stories)
+    logger.info("Imported %d stories in %.2fs", created, seconds)
+    return {
+        "created": created,
+        "failed": len(items) - created,
+        "seconds": round(seconds, 3),
+        "stories_per_second": round(created / seconds, 1) if seconds > 0 else None,
+        "results": results,
+    }
 
 @router.post("/stories", response_model=Story)
-async def add_story(story_in: StoryIn):
+async def add_story(story_in: StoryIn, conn: asyncpg.Connection = Depends(get_conn), ner: NERService = Depends(get_ner), responses: ResponseCache = Depends(get_response_cache), kinship: KinshipService = Depends(get_kinship)):
     date_value = story_in.date if story_in.date else datetime.now().strftime("%Y-%m-%d")
     title = generate_title(story_in.content)
-    doc = nlp(story_in.content)
-    entities = [
-        {"text": ent.text, "label": ent.label_}
-        for ent in doc.ents
-    ]
-    raw_person_names = set(ent["text"] for ent in entities if ent["label"] == "PERSON")
-    person_names = set()
-    for name in raw_person_names:
-        if not any((name != other and name in other) for other in raw_person_names):
-            person_names.add(name)
-    for name in raw_person_names:
-        if all((name == other or name not in other) for other in raw_person_names):
-            person_names.add(name)
-    conn = await asyncpg.connect(DATABASE_URL)
-    # Fetch all people and their nicknames for this user
-    people_rows = await conn.fetch('SELECT id, name, nicknames FROM people WHERE user_id = $1', story_in.user_id)
-    name_to_id = {row['name']: row['id'] for row in people_rows}
-    nickname_to_id = {}
-    for row in people_rows:
-        if row['nicknames']:
-            for nickname in row['nicknames']:
-                nickname_to_id[nickname] = row['id']
-    # Build a set of all people IDs to associate with the story
-    all_people_ids = set()
+    entities = await ner.extract(story_in.content)
+    person_names = people_from_entities(entities)
     # Accept both IDs and names in story_in.people_ids
-    for val in story_in.people_ids:
-        if isinstance(val, int):
-            all_people_ids.add(val)
-        elif isinstance(val, str):
-            # Try to resolve as name or nickname
-            person_id = name_to_id.get(val) or nickname_to_id.get(val)
-            if person_id:
-                all_people_ids.add(person_id)
-            else:
-                # Insert new person and get ID
-                new_row = await conn.fetchrow(
-                    'INSERT INTO people (name, user_id, nicknames) VALUES ($1, $2, $3) RETURNING id',
-                    val, story_in.user_id, []
-                )
-                all_people_ids.add(new_row['id'])
-    # Add NER-detected people (by name) as well
-    for person_name in person_names:
-        person_id = name_to_id.get(person_name) or nickname_to_id.get(person_name)
-        if person_id:
-            all_people_ids.add(person_id)
-        else:
-            new_row = await conn.fetchrow(
-                'INSERT INTO people (name, user_id, nicknames) VALUES ($1, $2, $3) RETURNING id',
-                person_name, story_in.user_id, []
-            )
-            all_people_ids.add(new_row['id'])
+    all_people_ids = set(val for val in story_in.people_ids if isinstance(val, int))
+    # Resolve given names and NER-detected people by name or nickname, creating any that are new
+    names = [val for val in story_in.people_ids if isinstance(val, str)] + sorted(person_names)
+    # Detected names may also match an existing person approximately ("Joe" -> "Grandpa Joe")
+    resolved, created = await resolve_people(conn, names, story_in.user_id, fuzzy=person_names)
+    all_people_ids.update(resolved.values())
     # --- Location logic ---
     location_id = None
     if story_in.location_id:
         location_id = story_in.location_id
     elif story_in.location_name:
         location_id = await get_or_create_location(conn, story_in.location_name, story_in.user_id)
-    # Insert the story with the updated people_ids list (IDs only)
+    # Insert the story with the updated people_ids list (IDs only) and read it back with names attached
+    date_start, date_end = parse_date_range(date_value)
     row = await conn.fetchrow(
-        'INSERT INTO stories (title, content, date, location_id, people_ids, photos, user_id) VALUES ($1, $2, $3, $4, $5, $6, $7) RETURNING *',
-        title, story_in.content, date_value, location_id, list(all_people_ids), story_in.photos, story_in.user_id
+        'WITH inserted AS (INSERT INTO stories (title, content, date, date_start, date_end, location_id, people_ids, photos, user_id) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9) RETURNING *)'
+        + story_select('inserted'),
+        title, story_in.content, date_value, date_start, date_end, location_id, list(all_people_ids), story_in.photos, story_in.user_id
     )
-    # Attach location_name and people_names for serialization
-    location_name = await get_location_name(conn, location_id) if location_id else None
-    people_names = await get_people_names(conn, list(all_people_ids)) if all_people_ids else []
-    await conn.close()
+    # New people, and story_count of the people mentioned, change GET /people. Dropped
+    # only now, so a listing read while the story was being written is not cached
+    responses.invalidate(story_in.user_id)
+    if created:
+        kinship.invalidate(story_in.user_id)
     story_data = serialize_row(row)
     story_data["entities"] = entities
-    story_data["location_name"] = location_name
-    story_data["people_names"] = people_names
     return story_data
 
 @router.delete("/stories/{story_id}")
-async def delete_story(request: Request, story_id: int = Path(...)):
+async def delete_story(request: Request, story_id: int = Path(...), conn: asyncpg.Connection = Depends(get_conn), responses: ResponseCache = Depends(get_response_cache)):
     user_id = request.query_params.get("user_id")
-    conn = await asyncpg.connect(DATABASE_URL)
     if user_id:
         # Only delete if the story belongs to the user
-        result = await conn.execute('DELETE FROM stories WHERE id = $1 AND user_id = $2', story_id, user_id)
+        row = await conn.fetchrow('DELETE FROM stories WHERE id = $1 AND user_id = $2 RETURNING user_id', story_id, user_id)
     else:
-        result = await conn.execute('DELETE FROM stories WHERE id = $1', story_id)
-    await conn.close()
-    if result == 'DELETE 1':
+        row = await conn.fetchrow('DELETE FROM stories WHERE id = $1 RETURNING user_id', story_id)
+    if row:
+        # The story no longer counts towards story_count in GET /people
+        responses.invalidate(row['user_id'])
         return {"message": "Story deleted"}
     else:
         raise HTTPException(status_code=404, detail="Story not found")
 
+async def update_story(conn, story_id, user_id, fields):
+    """
+    Apply any subset of title, date, people_ids and location_id/location_name to a
+    story in one transaction: new people and locations are resolved set-wise, then a
+    single UPDATE ... RETURNING writes the story and reads it back with names attached.
+    Returns the row and the ids of any people created; 404 if there is no such story
+    (for this user), in which case nothing is created.
+    """
+    assignments = {}
+    created = []
+    async with conn.transaction():
+        if 'title' in fields:
+            assignments['title'] = fields['title']
+        if 'date' in fields:
+            assignments['date'] = fields['date']
+            assignments['date_start'], assignments['date_end'] = parse_date_range(fields['date'])
+        if 'people_ids' in fields:
+            # Accept both IDs and names, creating people for names that are new
+            people_ids = set(val for val in fields['people_ids'] if isinstance(val, int))
+            resolved, created = await resolve_people(conn, [val for val in fields['people_ids'] if isinstance(val, str)], user_id)
+            people_ids.update(resolved.values())
+            assignments['people_ids'] = list(people_ids)
+        if fields.get('location_id'):
+            assignments['location_id'] = fields['location_id']
+        elif fields.get('location_name'):
+            resolved = await resolve_locations(conn, [fields['location_name']], user_id)
+            assignments['location_id'] = resolved[fields['location_name']]
+        elif 'location_id' in fields or 'location_name' in fields:
+            assignments['location_id'] = None
+        args = list(assignments.values()) + [story_id]
+        sets = ', '.join(f'{column} = ${index}' for index, column in enumerate(assignments, 1))
+        where = f'id = ${len(args)}'
+        if user_id:
+            args.append(user_id)
+            where += f' AND user_id = ${len(args)}'
+        row = await conn.fetchrow(f'WITH updated AS (UPDATE stories SET {sets} WHERE {where} RETURNING *)' + story_select('updated'), *args)
+        if row is None:
+            # Roll back any people or locations created for a story that does not exist
+            raise HTTPException(status_code=404, detail="Story not found")
+    return row, created
+
+@router.patch("/stories/{story_id}", response_model=Story)
+async def patch_story(update: StoryUpdate, request: Request, story_id: int = Path(...), conn: asyncpg.Connection = Depends(get_conn), responses: ResponseCache = Depends(get_response_cache), kinship: KinshipService = Depends(get_kinship)):
+    """
+    Update any subset of title, date, people_ids (ids or names) and location
+    (location_id or location_name; null clears it) in one round trip.
+    """
+    user_id = request.query_params.get("user_id")
+    fields = update.model_dump(exclude_unset=True)
+    if not fields:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    if 'title' in fields and fields['title'] is None:
+        raise HTTPException(status_code=400, detail="Title is required")
+    if 'date' in fields and fields['date'] is None:
+        raise HTTPException(status_code=400, detail="Date is required")
+    if 'people_ids' in fields and fields['people_ids'] is None:
+        raise HTTPException(status_code=400, detail="People is required")
+    row, created = await update_story(conn, story_id, user_id, fields)
+    if 'people_ids' in fields or 'location_id' in fields or 'location_name' in fields:
+        # New people and locations, and story_count of the people mentioned, change GET /people
+        responses.invalidate(row['user_id'])
+    if created:
+        kinship.invalidate(row['user_id'])
+    return serialize_row(row)
+
 # PATCH /stories/{story_id}/title
 @router.patch("/stories/{story_id}/title", response_model=Story)
-async def update_story_title(update: TitleUpdate, request: Request, story_id: int = Path(...)):
+async def update_story_title(update: TitleUpdate, request: Request, story_id: int = Path(...), conn: asyncpg.Connection = Depends(get_conn)):
     user_id = request.query_params.get("user_id")
     if update.title is None:
         raise HTTPException(status_code=400, detail="Title is required")
-    conn = await asyncpg.connect(DATABASE_URL)
-    if user_id:
-        await conn.execute('UPDATE stories SET title = $1 WHERE id = $2 AND user_id = $3', update.title, story_id, user_id)
-    else:
-        await conn.execute('UPDATE stories SET title = $1 WHERE id = $2', update.title, story_id)
-    row = await conn.fetchrow('SELECT * FROM stories WHERE id = $1', story_id)
-    await conn.close()
-    if row:
-        return serialize_row(row)
-    else:
-        raise HTTPException(status_code=404, detail="Story not found")
+    row, _ = await update_story(conn, story_id, user_id, {'title': update.title})
+    return serialize_row(row)
 
 # PATCH /stories/{story_id}/date
 @router.patch("/stories/{story_id}/date", response_model=Story)
-async def update_story_date(update: DateUpdate, request: Request, story_id: int = Path(...)):
+async def update_story_date(update: DateUpdate, request: Request, story_id: int = Path(...), conn: asyncpg.Connection = Depends(get_conn)):
     user_id = request.query_params.get("user_id")
     if update.date is None:
         raise HTTPException(status_code=400, detail="Date is required")
-    conn = await asyncpg.connect(DATABASE_URL)
-    if user_id:
-        await conn.execute('UPDATE stories SET date = $1 WHERE id = $2 AND user_id = $3', update.date, story_id, user_id)
-    else:
-        await conn.execute('UPDATE stories SET date = $1 WHERE id = $2', update.date, story_id)
-    row = await conn.fetchrow('SELECT * FROM stories WHERE id = $1', story_id)
-    await conn.close()
-    if row:
-        return serialize_row(row)
-    else:
-        raise HTTPException(status_code=404, detail="Story not found")
+    row, _ = await update_story(conn, story_id, user_id, {'date': update.date})
+    return serialize_row(row)
 
 # PATCH /stories/{story_id}/people
 @router.patch("/stories/{story_id}/people", response_model=Story)
-async def update_story_people(update: PeopleUpdate, request: Request, story_id: int = Path(...)):
+async def update_story_people(update: PeopleUpdate, request: Request, story_id: int = Path(...), conn: asyncpg.Connection = Depends(get_conn), responses: ResponseCache = Depends(get_response_cache), kinship: KinshipService = Depends(get_kinship)):
     user_id = request.query_params.get("user_id")
     if update.people_ids is None:
         raise HTTPException(status_code=400, detail="People is required")
-    conn = await asyncpg.connect(DATABASE_URL)
-    # Fetch all people and their nicknames for this user
-    people_rows = await conn.fetch('SELECT id, name, nicknames FROM people WHERE user_id = $1', user_id)
-    name_to_id = {row['name']: row['id'] for row in people_rows}
-    nickname_to_id = {}
-    for row in people_rows:
-        if row['nicknames']:
-            for nickname in row['nicknames']:
-                nickname_to_id[nickname] = row['id']
-    all_people_ids = set()
-    for val in update.people_ids:
-        if isinstance(val, int):
-            all_people_ids.add(val)
-        elif isinstance(val, str):
-            person_id = name_to_id.get(val) or nickname_to_id.get(val)
-            if person_id:
-                all_people_ids.add(person_id)
-            else:
-                new_row = await conn.fetchrow(
-                    'INSERT INTO people (name, user_id, nicknames) VALUES ($1, $2, $3) RETURNING id',
-                    val, user_id, []
-                )
-                all_people_ids.add(new_row['id'])
-    if user_id:
-        await conn.execute('UPDATE stories SET people_ids = $1 WHERE id = $2 AND user_id = $3', list(all_people_ids), story_id, user_id)
-    else:
-        await conn.execute('UPDATE stories SET people_ids = $1 WHERE id = $2', list(all_people_ids), story_id)
-    row = await conn.fetchrow('SELECT * FROM stories WHERE id = $1', story_id)
-    people_names = await get_people_names(conn, list(all_people_ids)) if all_people_ids else []
-    await conn.close()
-    if row:
-        story_data = serialize_row(row)
-        story_data["people_names"] = people_names
-        return story_data
-    else:
-        raise HTTPException(status_code=404, detail="Story not found")
+    row, created = await update_story(conn, story_id, user_id, {'people_ids': update.people_ids})
+    # New people, and story_count of the people mentioned, change GET /people
+    responses.invalidate(row['user_id'])
+    if created:
+        kinship.invalidate(row['user_id'])
+    return serialize_row(row)
 
 # PATCH /stories/{story_id}/location
 @router.patch("/stories/{story_id}/location", response_model=Story)
-async def update_story_location(update: LocationUpdate, request: Request, story_id: int = Path(...)):
+async def update_story_location(update: LocationUpdate, request: Request, story_id: int = Path(...), conn: asyncpg.Connection = Depends(get_conn), responses: ResponseCache = Depends(get_response_cache)):
     user_id = request.query_params.get("user_id")
     if not update.location_name and not update.location_id:
         raise HTTPException(status_code=400, detail="Location name or ID is required")
-    conn = await asyncpg.connect(DATABASE_URL)
-    # Resolve location_id
-    location_id = update.location_id if hasattr(update, 'location_id') and update.location_id else None
-    if not location_id and update.location_name:
-        location_id = await get_or_create_location(conn, update.location_name, user_id)
-    if user_id:
-        await conn.execute('UPDATE stories SET location_id = $1 WHERE id = $2 AND user_id = $3', location_id, story_id, user_id)
-    else:
-        await conn.execute('UPDATE stories SET location_id = $1 WHERE id = $2', location_id, story_id)
-    row = await conn.fetchrow('SELECT * FROM stories WHERE id = $1', story_id)
-    location_name = await get_location_name(conn, location_id) if location_id else None
-    await conn.close()
-    if row:
-        story_data = serialize_row(row)
-        story_data["location_name"] = location_name
-        return story_data
-    else:
-        raise HTTPException(status_code=404, detail="Story not found")
+    row, _ = await update_story(conn, story_id, user_id, {'location_id': update.location_id, 'location_name': update.location_name})
+    responses.invalidate(row['user_id'])
+    return serialize_row(row)
 
 @router.post("/stories/{story_id}/upload-photos")
-async def upload_story_photos(story_id: int, files: list[UploadFile] = File(...)):
-    conn = await asyncpg.connect(DATABASE_URL)
+async def upload_story_photos(story_id: int, files: list[UploadFile] = File(...), conn: asyncpg.Connection = Depends(get_conn), media: MediaService = Depends(get_media)):
     row = await conn.fetchrow('SELECT * FROM stories WHERE id = $1', story_id)
     if not row:
-        await conn.close()
         raise HTTPException(status_code=404, detail="Story not found")
     story = dict(row)
     uploaded_files = []
     photos = story.get('photos', []) or []
     if isinstance(photos, str):
-        import json
         try:
             photos = json.loads(photos)
         except Exception:
             photos = []
+    rejected = []
     for file in files:
         if not file.content_type.startswith('image/'):
-            continue  # skip non-images
-        file_extension = file.filename.split('.')[-1]
-        filename = f"story_{story_id}_{len(photos)}_{file.filename}"
-        file_path = UPLOAD_DIR / filename
+            rejected.append({"filename": file.filename, "detail": "Not an image"})
+            continue
         try:
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-        except Exception:
-            continue  # skip failed uploads
-        url = f"/uploads/{filename}"
+            stored = await store_upload(file)
+        except HTTPException as e:
+            rejected.append({"filename": file.filename, "detail": e.detail})
+            continue
+        except OSError:
+            logger.exception("Could not store upload %s", file.filename)
+            rejected.append({"filename": file.filename, "detail": "Could not store file"})
+            continue
+        url = stored.url
+        media.schedule(stored.path)
+        if url in photos:
+            continue  # same photo already on this story
         photos.append(url)
         uploaded_files.append(url)
     # Update DB
     await conn.execute('UPDATE stories SET photos = $1 WHERE id = $2', photos, story_id)
-    await conn.close()
-    return {"uploaded": uploaded_files, "all_photos": photos}
+    return {"uploaded": uploaded_files, "rejected": rejected, "all_photos": photos}
 
-@router.get("/family-tree")
-async def get_family_tree(request: Request):
-    user_id = request.query_params.get("user_id")
-    conn = await asyncpg.connect(DATABASE_URL)
-    if user_id:
-        people_rows = await conn.fetch('SELECT * FROM people WHERE user_id = $1', user_id)
-        relationships_rows = await conn.fetch('SELECT * FROM relationships WHERE user_id = $1', user_id)
+def build_family_tree(people, relationships, root_id=None, depth=None):
+    """
+    Tree nodes with children/parents lists, built from adjacency maps in one pass
+    over the relationships. With root_id only the root and its descendants up to
+    `depth` generations are returned.
+    """
+    children = {}
+    parents = {}
+    for r in relationships:
+        children.setdefault(r['parent_id'], []).append(r['child_id'])
+        parents.setdefault(r['child_id'], []).append(r['parent_id'])
+    people_by_id = {person['id']: person for person in people}
+    if root_id is None:
+        ids = list(people_by_id)
     else:
-        people_rows = await conn.fetch('SELECT * FROM people')
-        relationships_rows = await conn.fetch('SELECT * FROM relationships')
-    await conn.close()
-    people = [dict(row) for row in people_rows]
-    relationships = [dict(row) for row in relationships_rows]
+        # Breadth-first walk down from the root; visited guards against cycles
+        ids = [root_id]
+        visited = {root_id}
+        frontier = [root_id]
+        generation = 0
+        while frontier and (depth is None or generation < depth):
+            next_frontier = []
+            for person_id in frontier:
+                for child_id in children.get(person_id, []):
+                    if child_id not in visited and child_id in people_by_id:
+                        visited.add(child_id)
+                        ids.append(child_id)
+                        next_frontier.append(child_id)
+            frontier = next_frontier
+            generation += 1
     tree_data = []
-    for person in people:
-        children = [r['child_id'] for r in relationships if r['parent_id'] == person['id']]
-        parents = [r['parent_id'] for r in relationships if r['child_id'] == person['id']]
+    for person_id in ids:
+        person = people_by_id[person_id]
         tree_data.append({
             "id": person['id'],
             "name": person['name'],
@@ -351,210 +687,37 @@ async def get_family_tree(request: Request):
             "birth_date": person['birth_date'],
             "death_date": person['death_date'],
             "gender": person['gender'],
-            "children": children,
-            "parents": parents
+            "children": children.get(person_id, []),
+            "parents": parents.get(person_id, [])
         })
     return tree_data
 
-@router.post("/people", response_model=Person)
-async def add_person(person_in: PersonIn):
-    conn = await asyncpg.connect(DATABASE_URL)
-    await conn.execute(
-        'INSERT INTO people (name, picture, birth_date, death_date, gender, user_id, nicknames) VALUES ($1, $2, $3, $4, $5, $6, $7)',
-        person_in.name, person_in.picture, person_in.birth_date, person_in.death_date, person_in.gender, person_in.user_id, person_in.nicknames
-    )
-    await conn.close()
-    return person_in
-
-@router.get("/people")
-async def get_people(request: Request):
-    user_id = request.query_params.get("user_id")
-    conn = await asyncpg.connect(DATABASE_URL)
-    if user_id:
-        rows = await conn.fetch('SELECT * FROM people WHERE user_id = $1 ORDER BY name', user_id)
-    else:
-        rows = await conn.fetch('SELECT * FROM people ORDER BY name')
-    await conn.close()
-    return [serialize_row(row) for row in rows]
-
-@router.get("/people/{person_id}")
-async def get_person(person_id: int, request: Request):
-    user_id = request.query_params.get("user_id")
-    conn = await asyncpg.connect(DATABASE_URL)
-    if user_id:
-        row = await conn.fetchrow('SELECT * FROM people WHERE id = $1 AND user_id = $2', person_id, user_id)
-    else:
-        row = await conn.fetchrow('SELECT * FROM people WHERE id = $1', person_id)
-    await conn.close()
-    if row:
-        return serialize_row(row)
-    raise HTTPException(status_code=404, detail="Person not found")
-
-@router.patch("/people/{person_id}/picture", response_model=Person)
-async def update_person_picture(person_id: int, update: PersonUpdate, request: Request):
-    user_id = request.query_params.get("user_id")
-    conn = await asyncpg.connect(DATABASE_URL)
-    if user_id:
-        row = await conn.fetchrow('SELECT * FROM people WHERE id = $1 AND user_id = $2', person_id, user_id)
-    else:
-        row = await conn.fetchrow('SELECT * FROM people WHERE id = $1', person_id)
-    if not row:
-        await conn.close()
-        raise HTTPException(status_code=404, detail="Person not found")
-    person = dict(row)
-    picture = update.picture if update.picture is not None else person.get('picture')
-    birth_date = update.birth_date if update.birth_date is not None else person.get('birth_date')
-    death_date = update.death_date if update.death_date is not None else person.get('death_date')
-    gender = update.gender if update.gender is not None else person.get('gender')
-    if user_id:
-        await conn.execute('UPDATE people SET picture = $1, birth_date = $2, death_date = $3, gender = $4 WHERE id = $5 AND user_id = $6', picture, birth_date, death_date, gender, person_id, user_id)
-    else:
-        await conn.execute('UPDATE people SET picture = $1, birth_date = $2, death_date = $3, gender = $4 WHERE id = $5', picture, birth_date, death_date, gender, person_id)
-    row = await conn.fetchrow('SELECT * FROM people WHERE id = $1', person_id)
-    await conn.close()
-    return serialize_row(row)
-
-@router.post("/people/{person_id}/add-nickname")
-async def add_nickname(person_id: int, nickname: str = Body(..., embed=True)):
-    conn = await asyncpg.connect(DATABASE_URL)
-    person = await conn.fetchrow('SELECT * FROM people WHERE id = $1', person_id)
-    if not person:
-        await conn.close()
-        raise HTTPException(status_code=404, detail="Person not found")
-    nicknames = person['nicknames'] or []
-    if nickname in nicknames:
-        await conn.close()
-        raise HTTPException(status_code=400, detail="Nickname already exists")
-    nicknames.append(nickname)
-    await conn.execute('UPDATE people SET nicknames = $1 WHERE id = $2', nicknames, person_id)
-    updated = await conn.fetchrow('SELECT * FROM people WHERE id = $1', person_id)
-    await conn.close()
-    return serialize_row(updated)
-
-@router.delete("/people/{person_id}/delete-nickname")
-async def delete_nickname(person_id: int, nickname: str = Body(..., embed=True)):
-    conn = await asyncpg.connect(DATABASE_URL)
-    person = await conn.fetchrow('SELECT * FROM people WHERE id = $1', person_id)
-    if not person:
-        await conn.close()
-        raise HTTPException(status_code=404, detail="Person not found")
-    nicknames = person['nicknames'] or []
-    if nickname not in nicknames:
-        await conn.close()
-        raise HTTPException(status_code=404, detail="Nickname not found")
-    nicknames = [n for n in nicknames if n != nickname]
-    await conn.execute('UPDATE people SET nicknames = $1 WHERE id = $2', nicknames, person_id)
-    updated = await conn.fetchrow('SELECT * FROM people WHERE id = $1', person_id)
-    await conn.close()
-    return serialize_row(updated)
-
-@router.post("/people/{person_id}/upload-picture")
-async def upload_person_picture(person_id: int, request: Request, file: UploadFile = File(...)):
-    user_id = request.query_params.get("user_id")
-    conn = await asyncpg.connect(DATABASE_URL)
-    if user_id:
-        row = await conn.fetchrow('SELECT * FROM people WHERE id = $1 AND user_id = $2', person_id, user_id)
-    else:
-        row = await conn.fetchrow('SELECT * FROM people WHERE id = $1', person_id)
-    if not row:
-        await conn.close()
-        raise HTTPException(status_code=404, detail="Person not found")
-    # Validate file type
-    if not file.content_type.startswith('image/'):
-        await conn.close()
-        raise HTTPException(status_code=400, detail="File must be an image")
-    # Create filename
-    file_extension = file.filename.split('.')[-1]
-    normalized_input = normalize_name(row['name'])
-    filename = f"{normalized_input}.{file_extension}"
-    file_path = UPLOAD_DIR / filename
-    # Save file
-    try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-    except Exception as e:
-        await conn.close()
-        raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
-    # Update person's picture field in DB
-    url = f"/uploads/{filename}"
-    if user_id:
-        await conn.execute('UPDATE people SET picture = $1 WHERE id = $2 AND user_id = $3', url, person_id, user_id)
-    else:
-        await conn.execute('UPDATE people SET picture = $1 WHERE id = $2', url, person_id)
-    await conn.close()
-    return {"filename": filename, "url": url}
-
-@router.patch("/people/{person_id}/birth-date", response_model=Person)
-async def update_person_birth_date(person_id: int, request: Request, birth_date: Optional[str] = None):
-    user_id = request.query_params.get("user_id")
-    conn = await asyncpg.connect(DATABASE_URL)
-    if user_id:
-        await conn.execute('UPDATE people SET birth_date = $1 WHERE id = $2 AND user_id = $3', birth_date, person_id, user_id)
-    else:
-        await conn.execute('UPDATE people SET birth_date = $1 WHERE id = $2', birth_date, person_id)
-    row = await conn.fetchrow('SELECT * FROM people WHERE id = $1', person_id)
-    await conn.close()
-    if row:
-        return serialize_row(row)
-    raise HTTPException(status_code=404, detail="Person not found")
-
-@router.patch("/people/{person_id}/death-date", response_model=Person)
-async def update_person_death_date(person_id: int, request: Request, death_date: Optional[str] = None):
-    user_id = request.query_params.get("user_id")
-    conn = await asyncpg.connect(DATABASE_URL)
-    if user_id:
-        await conn.execute('UPDATE people SET death_date = $1 WHERE id = $2 AND user_id = $3', death_date, person_id, user_id)
-    else:
-        await conn.execute('UPDATE people SET death_date = $1 WHERE id = $2', death_date, person_id)
-    row = await conn.fetchrow('SELECT * FROM people WHERE id = $1', person_id)
-    await conn.close()
-    if row:
-        return serialize_row(row)
-    raise HTTPException(status_code=404, detail="Person not found")
-
-@router.patch("/people/{person_id}/gender", response_model=Person)
-async def update_person_gender(person_id: int, request: Request, gender: Optional[str] = None):
+@router.get("/family-tree")
+async def get_family_tree(request: Request, root_id: Optional[int] = None, depth: Optional[int] = None, conn: asyncpg.Connection = Depends(get_conn)):
     user_id = request.query_params.get("user_id")
-    conn = await asyncpg.connect(DATABASE_URL)
+    if depth is not None and depth < 0:
+        raise HTTPException(status_code=400, detail="Depth must not be negative")
     if user_id:
-        await conn.execute('UPDATE people SET gender = $1 WHERE id = $2 AND user_id = $3', gender, person_id, user_id)
-    else:
-        await conn.execute('UPDATE people SET gender = $1 WHERE id = $2', gender, person_id)
-    row = await conn.fetchrow('SELECT * FROM people WHERE id = $1', person_id)
-    await conn.close()
-    if row:
-        return serialize_row(row)
-    raise HTTPException(status_code=404, detail="Person not found")
-
-@router.patch("/people/{person_id}/name", response_model=Person)
-async def update_person_name(person_id: int, update: NameUpdate):
-    conn = await asyncpg.connect(DATABASE_URL)
-    await conn.execute('UPDATE people SET name = $1 WHERE id = $2', update.name, person_id)
-    row = await conn.fetchrow('SELECT * FROM people WHERE id = $1', person_id)
-    await conn.close()
-    if row:
-        return serialize_row(row)
-    raise HTTPException(status_code=404, detail="Person not found")
-
-@router.delete("/people/{person_id}")
-async def delete_person(person_id: int):
-    conn = await asyncpg.connect(DATABASE_URL)
-    result = await conn.execute('DELETE FROM people WHERE id = $1', person_id)
-    await conn.close()
-    if result == 'DELETE 1':
-        return {"message": "Person deleted"}
+        people_rows = await conn.fetch('SELECT id, name, picture, birth_date, death_date, gender FROM people WHERE user_id = $1', user_id)
+        relationships_rows = await conn.fetch('SELECT parent_id, child_id FROM relationships WHERE user_id = $1', user_id)
     else:
+        people_rows = await conn.fetch('SELECT id, name, picture, birth_date, death_date, gender FROM people')
+        relationships_rows = await conn.fetch('SELECT parent_id, child_id FROM relationships')
+    people = [dict(row) for row in people_rows]
+    if root_id is not None and not any(person['id'] == root_id for person in people):
         raise HTTPException(status_code=404, detail="Person not found")
+    return build_family_tree(people, relationships_rows, root_id, depth)
 
 @router.post("/ner")
-async def named_entity_recognition(text: str = Body(..., embed=True)):
+async def named_entity_recognition(text: str = Body(..., embed=True), ner: NERService = Depends(get_ner)):
     """
     Accepts a POST request with a JSON body: {"text": "..."}
     Returns a list of entities with their text and label.
     """
-    doc = nlp(text)
-    entities = [
-        {"text": ent.text, "label": ent.label_}
-        for ent in doc.ents
-    ]
-    return {"entities": entities}
\ No newline at end of file
+    entities = await ner.extract(text)
+    return {"entities": entities}
+
+@router.get("/ner/stats")
+async def named_entity_recognition_stats(ner: NERService = Depends(get_ner)):
+    """Hit/miss counters of the NER result cache."""
+    return ner.cache.stats() if ner.cache else {}
\ No newline at end of file
@@ -1,27 +1,58 @@
-import os
-from fastapi import APIRouter, HTTPException, Request, UploadFile, File
-from dotenv import load_dotenv
+import json
+from contextlib import aclosing
+import httpx
+from fastapi import APIRouter, HTTPException, UploadFile, File, Depends
+from fastapi.responses import StreamingResponse
+from appfolder.transcription import TranscriptionService, get_transcription, spool_upload, remove_quietly
 
 router = APIRouter()
 
-load_dotenv(dotenv_path='appfolder/.env')
-DEEPGRAM_API_KEY = os.getenv("DEEPGRAM_KEY")
-DEEPGRAM_API_URL = "https://api.deepgram.com/v1/listen"
+def transcription_error(e: httpx.HTTPError) -> HTTPException:
+    if isinstance(e, httpx.TimeoutException):
+        return HTTPException(status_code=504, detail="Transcription timed out")
+    if isinstance(e, httpx.HTTPStatusError):
+        return HTTPException(status_code=502, detail=f"Transcription failed with status {e.response.status_code}")
+    return HTTPException(status_code=502, detail=f"Transcription service unreachable: {e}")
 
 @router.post("/transcribe")
-async def transcribe(audio: UploadFile = File(...)):
-    audio_bytes = await audio.read()
+async def transcribe(audio: UploadFile = File(...), transcription: TranscriptionService = Depends(get_transcription)):
+    spooled = await spool_upload(audio)
+    try:
+        return await transcription.transcribe_file(spooled)
+    except httpx.HTTPError as e:
+        raise transcription_error(e)
+    finally:
+        await remove_quietly(spooled.path)
 
-    headers = {
-        "Authorization": f"Token {DEEPGRAM_API_KEY}",
-        "Content-Type": "application/octet-stream",
-    }
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-    response = requests.post(
-        DEEPGRAM_API_URL,
-        headers=headers,
-        data=audio_bytes,
-        params={"punctuate": True, "language": "en"}
-    )
+@router.post("/transcribe/stream")
+async def transcribe_stream(audio: UploadFile = File(...), transcription: TranscriptionService = Depends(get_transcription)):
+    """
+    Same as /transcribe, reported as Server-Sent Events: a `segment` event with the
+    text stitched so far each time a segment finishes, then `done` with the full
+    result (or `error`).
+    """
+    # Spool before responding; the upload is closed once the handler returns
+    spooled = await spool_upload(audio)
+
+    async def events():
+        try:
+            async with aclosing(transcription.progress(spooled)) as progress:
+                async for event in progress:
+                    if event["event"] == "done":
+                        yield sse("done", event["result"])
+                    else:
+                        yield sse("segment", {k: v for k, v in event.items() if k != "event"})
+        except httpx.HTTPError as e:
+            error = transcription_error(e)
+            yield sse("error", {"status": error.status_code, "detail": error.detail})
+        finally:
+            await remove_quietly(spooled.path)
 
-    return response.json()
\ No newline at end of file
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,16 @@
+import html
+
+# Text search configuration of the stories.search column (migrations/0002_story_search.sql),
+# used by every query against it
+SEARCH_CONFIG = 'english'
+# Private-use characters mark matches in ts_headline output; they are swapped for
+# <mark> tags after the story text has been HTML-escaped
+HIGHLIGHT_START = '\ue000'
+HIGHLIGHT_STOP = '\ue001'
+SNIPPET_OPTIONS = f'StartSel="{HIGHLIGHT_START}", StopSel="{HIGHLIGHT_STOP}", MaxFragments=2, MaxWords=30, MinWords=10, FragmentDelimiter=" … "'
+
+def highlight(snippet):
+    """HTML-safe snippet with matches wrapped in <mark>."""
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_STOP, '</mark>')
@@ -0,0 +1,85 @@
+import asyncio
+import hashlib
+import mimetypes
+import os
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+import aiofiles
+import aiofiles.os
+from fastapi import HTTPException, UploadFile
+
+UPLOAD_DIR = Path("uploads")
+UPLOAD_DIR.mkdir(exist_ok=True)
+# Content-addressed blobs live under uploads/blobs/<aa>/<bb>/<sha256><ext>
+BLOB_DIR = UPLOAD_DIR / "blobs"
+TMP_DIR = UPLOAD_DIR / "tmp"
+
+# Upload settings (override in appfolder/.env)
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', str(20 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+
+@dataclass
+class StoredFile:
+    sha256: str
+    path: Path
+    url: str
+    size: int
+    deduplicated: bool
+
+def blob_path(sha256: str, ext: str) -> Path:
+    return BLOB_DIR / sha256[:2] / sha256[2:4] / f"{sha256}{ext}"
+
+def blob_url(path: Path) -> str:
+    return "/" + path.as_posix()
+
+def upload_extension(file: UploadFile) -> str:
+    # Prefer the content type so identical bytes get the same name whatever the filename says
+    ext = mimetypes.guess_extension(file.content_type or '') or ''
+    if not ext and file.filename and '.' in file.filename:
+        ext = '.' + file.filename.rsplit('.', 1)[-1]
+    ext = ext.lower()
+    return ext if ext[1:].isalnum() and len(ext) <= 10 else ''
+
+async def store_upload(file: UploadFile, max_bytes: int = UPLOAD_MAX_BYTES) -> StoredFile:
+    """
+    Stream an upload to disk in chunks, hashing it on the way, and keep it under its
+    SHA-256. A blob that is already stored is not written twice. Raises 413 when the
+    file is larger than max_bytes.
+    """
+    # Starlette has already spooled the part, so its size is known; refuse it before
+    # copying it again
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"File is larger than {max_bytes} bytes")
+    TMP_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = TMP_DIR / uuid.uuid4().hex
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as out:
+            while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"File is larger than {max_bytes} bytes")
+                digest.update(chunk)
+                await out.write(chunk)
+        sha256 = digest.hexdigest()
+        path = blob_path(sha256, upload_extension(file))
+        if await aiofiles.os.path.exists(path):
+            try:
+                # Restart the upload GC grace period, so an old orphan uploaded again is
+                # not collected before the row that references it is written
+                await asyncio.to_thread(os.utime, path)
+            except FileNotFoundError:
+                # Collected in the meantime; store this copy instead
+                pass
+            else:
+                await aiofiles.os.remove(tmp_path)
+                return StoredFile(sha256, path, blob_url(path), size, True)
+        await aiofiles.os.makedirs(path.parent, exist_ok=True)
+        await aiofiles.os.replace(tmp_path, path)
+        return StoredFile(sha256, path, blob_url(path), size, False)
+    except BaseException:
+        if await aiofiles.os.path.exists(tmp_path):
+            await aiofiles.os.remove(tmp_path)
+        raise
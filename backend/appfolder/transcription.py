@@ -0,0 +1,394 @@
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import string
+import uuid
+import wave
+from collections import OrderedDict
+from contextlib import aclosing
+from dataclasses import dataclass
+from pathlib import Path
+import aiofiles
+import aiofiles.os
+import httpx
+from fastapi import HTTPException, Request, UploadFile
+from dotenv import load_dotenv
+from appfolder.storage import TMP_DIR
+
+load_dotenv(dotenv_path='appfolder/.env')
+
+# Transcription settings (override in appfolder/.env)
+# 'deepgram', or 'local' for the stand-in server in appfolder/transcription_stub.py
+TRANSCRIPTION_BACKEND = os.getenv('TRANSCRIPTION_BACKEND', 'deepgram')
+DEEPGRAM_API_KEY = os.getenv("DEEPGRAM_KEY")
+DEEPGRAM_API_URL = os.getenv('DEEPGRAM_API_URL', "https://api.deepgram.com/v1/listen")
+TRANSCRIPTION_LOCAL_URL = os.getenv('TRANSCRIPTION_LOCAL_URL', "http://127.0.0.1:8001/v1/listen")
+# Provider calls in flight at once; further requests wait their turn
+TRANSCRIPTION_CONCURRENCY = int(os.getenv('TRANSCRIPTION_CONCURRENCY', '8'))
+TRANSCRIPTION_MAX_CONNECTIONS = int(os.getenv('TRANSCRIPTION_MAX_CONNECTIONS', '16'))
+TRANSCRIPTION_CONNECT_TIMEOUT = float(os.getenv('TRANSCRIPTION_CONNECT_TIMEOUT', '10'))
+# Long recordings take a while to transcribe, so the read timeout is generous
+TRANSCRIPTION_TIMEOUT = float(os.getenv('TRANSCRIPTION_TIMEOUT', '300'))
+TRANSCRIPTION_CHUNK_BYTES = 64 * 1024
+TRANSCRIPTION_MAX_BYTES = int(os.getenv('TRANSCRIPTION_MAX_BYTES', str(500 * 1024 * 1024)))
+# Long recordings are cut into overlapping segments that are transcribed in parallel
+TRANSCRIPTION_SEGMENT_SECONDS = float(os.getenv('TRANSCRIPTION_SEGMENT_SECONDS', '120'))
+TRANSCRIPTION_OVERLAP_SECONDS = float(os.getenv('TRANSCRIPTION_OVERLAP_SECONDS', '2'))
+# Segments of one recording in flight at once (the global cap above still applies)
+TRANSCRIPTION_FANOUT = int(os.getenv('TRANSCRIPTION_FANOUT', '4'))
+# Extra attempts for a segment after a timeout, connection error or 5xx
+TRANSCRIPTION_RETRIES = int(os.getenv('TRANSCRIPTION_RETRIES', '2'))
+# Results by audio hash: in memory, and as JSON files in this directory ('' for memory only)
+TRANSCRIPTION_CACHE_SIZE = int(os.getenv('TRANSCRIPTION_CACHE_SIZE', '128'))
+TRANSCRIPTION_CACHE_DIR = os.getenv('TRANSCRIPTION_CACHE_DIR', 'transcripts')
+
+logger = logging.getLogger("uvicorn.error")
+
+async def upload_chunks(file: UploadFile, chunk_size: int = TRANSCRIPTION_CHUNK_BYTES):
+    """Read an upload piece by piece so it is never held in memory whole."""
+    while chunk := await file.read(chunk_size):
+        yield chunk
+
+@dataclass
+class SpooledAudio:
+    path: Path
+    sha256: str
+    size: int
+    content_type: str
+
+async def spool_upload(file: UploadFile, max_bytes: int = TRANSCRIPTION_MAX_BYTES) -> SpooledAudio:
+    """Stream an upload to a temporary file, hashing it on the way. Raises 413 past max_bytes."""
+    TMP_DIR.mkdir(parents=True, exist_ok=True)
+    path = TMP_DIR / f"audio-{uuid.uuid4().hex}"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(path, "wb") as out:
+            async for chunk in upload_chunks(file):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"Recording is larger than {max_bytes} bytes")
+                digest.update(chunk)
+                await out.write(chunk)
+    except BaseException:
+        await remove_quietly(path)
+        raise
+    return SpooledAudio(path, digest.hexdigest(), size, file.content_type)
+
+async def remove_quietly(path: Path):
+    try:
+        await aiofiles.os.remove(path)
+    except FileNotFoundError:
+        pass
+
+async def file_chunks(path: Path, chunk_size: int = TRANSCRIPTION_CHUNK_BYTES):
+    async with aiofiles.open(path, "rb") as f:
+        while chunk := await f.read(chunk_size):
+            yield chunk
+
+@dataclass
+class Segment:
+    index: int
+    # Position in the recording, in seconds
+    start: float
+    end: float
+    first_frame: int
+    frames: int
+
+def plan_segments(path: Path, seconds: float = TRANSCRIPTION_SEGMENT_SECONDS, overlap: float = TRANSCRIPTION_OVERLAP_SECONDS):
+    """
+    Overlapping segments covering a WAV file, or None when the file is not WAV.
+    Each segment starts `overlap` seconds before the previous one ends, so a word
+    cut at a boundary is heard whole by one of them.
+    """
+    try:
+        with wave.open(str(path), 'rb') as w:
+            rate, total = w.getframerate(), w.getnframes()
+    except (wave.Error, EOFError):
+        return None
+    step = max(1, int((seconds - overlap) * rate))
+    length = max(step, int(seconds * rate))
+    segments = []
+    first = 0
+    while True:
+        frames = min(length, total - first)
+        segments.append(Segment(len(segments), first / rate, (first + frames) / rate, first, frames))
+        if first + frames >= total:
+            return segments
+        first += step
+
+def read_segment(path: Path, segment: Segment) -> bytes:
+    """One segment as a standalone WAV file."""
+    with wave.open(str(path), 'rb') as source:
+        params = source.getparams()
+        source.setpos(segment.first_frame)
+        frames = source.readframes(segment.frames)
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as target:
+        target.setparams(params)
+        target.writeframes(frames)
+    return out.getvalue()
+
+async def convert_to_wav(path: Path):
+    """
+    Decode any recording (browsers send WebM/Opus) to 16 kHz mono WAV with ffmpeg so it
+    can be segmented. None when ffmpeg is not installed or cannot read the file.
+    """
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        return None
+    target = path.with_name(path.name + ".wav")
+    process = await asyncio.create_subprocess_exec(
+        ffmpeg, '-nostdin', '-v', 'error', '-y', '-i', str(path), '-ac', '1', '-ar', '16000', '-f', 'wav', str(target),
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+    )
+    _, stderr = await process.communicate()
+    if process.returncode != 0:
+        logger.warning("ffmpeg could not decode %s: %s", path.name, stderr.decode(errors='replace').strip())
+        await remove_quietly(target)
+        return None
+    return target
+
+def _alternative(result):
+    try:
+        return result["results"]["channels"][0]["alternatives"][0]
+    except (KeyError, IndexError, TypeError):
+        return {}
+
+def _word_key(word):
+    return word.strip(string.punctuation).lower()
+
+def _merge_text(left, right, max_overlap=50):
+    """Join two transcripts, dropping the longest run of words that ends one and starts the other."""
+    a, b = left.split(), right.split()
+    for k in range(min(len(a), len(b), max_overlap), 0, -1):
+        if [_word_key(w) for w in a[-k:]] == [_word_key(w) for w in b[:k]]:
+            return ' '.join(a + b[k:])
+    return ' '.join(a + b)
+
+def stitch(segments, results):
+    """
+    One Deepgram-shaped result from consecutive segment results. With word timings each
+    overlap is cut at its midpoint; otherwise overlapping text is matched word by word.
+    """
+    alternatives = [_alternative(result) for result in results]
+    if alternatives and all(alt.get("words") for alt in alternatives):
+        words = []
+        for i, (segment, alt) in enumerate(zip(segments, alternatives)):
+            low = (segment.start + segments[i - 1].end) / 2 if i > 0 else float('-inf')
+            high = (segments[i + 1].start + segment.end) / 2 if i + 1 < len(segments) else float('inf')
+            for word in alt["words"]:
+                start = word.get("start", 0) + segment.start
+                if low <= start < high:
+                    words.append({**word, "start": start, "end": word.get("end", 0) + segment.start})
+        transcript = ' '.join(word.get("punctuated_word") or word.get("word", "") for word in words)
+    else:
+        words = None
+        transcript = ''
+        for alt in alternatives:
+            transcript = _merge_text(transcript, alt.get("transcript") or '')
+    alternative = {"transcript": transcript}
+    if words is not None:
+        alternative["words"] = words
+    return {"results": {"channels": [{"alternatives": [alternative]}]}}
+
+class TranscriptCache:
+    """LRU of finished transcripts keyed by backend and audio hash, optionally backed by JSON files."""
+
+    def __init__(self, size=TRANSCRIPTION_CACHE_SIZE, directory=TRANSCRIPTION_CACHE_DIR):
+        self.size = size
+        self.directory = Path(directory) if directory else None
+        self._entries = OrderedDict()
+
+    def _file(self, key):
+        backend, sha256 = key
+        return self.directory / backend / f"{sha256}.json"
+
+    async def get(self, key):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        if self.directory is None:
+            return None
+        try:
+            async with aiofiles.open(self._file(key)) as f:
+                result = json.loads(await f.read())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        self._remember(key, result)
+        return result
+
+    async def put(self, key, result):
+        self._remember(key, result)
+        if self.directory is None:
+            return
+        path = self._file(key)
+        await aiofiles.os.makedirs(path.parent, exist_ok=True)
+        tmp = path.with_name(f".{uuid.uuid4().hex}.json")
+        async with aiofiles.open(tmp, "w") as f:
+            await f.write(json.dumps(result))
+        await aiofiles.os.replace(tmp, path)
+
+    def _remember(self, key, result):
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+def _is_transient(error):
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500 or error.response.status_code == 429
+    return isinstance(error, httpx.TransportError)
+
+class DeepgramBackend:
+    """Deepgram's pre-recorded /v1/listen API. Audio is streamed as the request body."""
+
+    name = 'deepgram'
+
+    def __init__(self, client: httpx.AsyncClient, url: str = DEEPGRAM_API_URL, api_key: str = DEEPGRAM_API_KEY):
+        self.client = client
+        self.url = url
+        self.api_key = api_key
+
+    async def transcribe(self, audio, content_type: str = None) -> dict:
+        headers = {"Content-Type": content_type or "application/octet-stream"}
+        if self.api_key:
+            headers["Authorization"] = f"Token {self.api_key}"
+        response = await self.client.post(
+            self.url,
+            headers=headers,
+            content=audio,
+            params={"punctuate": "true", "language": "en"},
+        )
+        response.raise_for_status()
+        return response.json()
+
+class LocalBackend(DeepgramBackend):
+    """Same protocol against the local stand-in server, for tests and benchmarks."""
+
+    name = 'local'
+
+    def __init__(self, client: httpx.AsyncClient, url: str = TRANSCRIPTION_LOCAL_URL):
+        super().__init__(client, url, api_key=None)
+
+BACKENDS = {backend.name: backend for backend in (DeepgramBackend, LocalBackend)}
+
+class TranscriptionService:
+    """
+    Sends audio to the configured backend through one shared HTTP client
+    (connection pooling, timeouts) and caps how many calls run at once.
+    Long WAV recordings (or anything ffmpeg can decode) are split into overlapping
+    segments transcribed in parallel; finished transcripts are cached by audio hash.
+    """
+
+    def __init__(self, backend, client: httpx.AsyncClient, concurrency: int = TRANSCRIPTION_CONCURRENCY,
+                 fanout: int = TRANSCRIPTION_FANOUT, cache: TranscriptCache = None):
+        self.backend = backend
+        self.client = client
+        self.fanout = max(1, fanout)
+        self.cache = cache or TranscriptCache()
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+
+    async def transcribe(self, audio, content_type: str = None) -> dict:
+        async with self._slots:
+            return await self.backend.transcribe(audio, content_type)
+
+    async def _transcribe_retrying(self, make_audio, content_type):
+        for attempt in range(TRANSCRIPTION_RETRIES + 1):
+            try:
+                return await self.transcribe(make_audio(), content_type)
+            except httpx.HTTPError as e:
+                if attempt == TRANSCRIPTION_RETRIES or not _is_transient(e):
+                    raise
+                logger.warning("Transcription attempt %d failed, retrying: %r", attempt + 1, e)
+                await asyncio.sleep(2 ** attempt)
+
+    async def transcribe_file(self, audio: SpooledAudio) -> dict:
+        result = None
+        async for event in self.progress(audio):
+            if event["event"] == "done":
+                result = event["result"]
+        return result
+
+    async def progress(self, audio: SpooledAudio):
+        """
+        Transcribe a spooled recording, yielding {"event": "segment", ...} as segments
+        finish (with the text stitched so far) and finally {"event": "done", "result": ...}.
+        """
+        key = (self.backend.name, audio.sha256)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            yield {"event": "done", "result": {**cached, "metadata": {**cached.get("metadata", {}), "cached": True}}}
+            return
+        wav = audio.path
+        segments = await asyncio.to_thread(plan_segments, wav)
+        if segments is None:
+            wav = await convert_to_wav(audio.path)
+            segments = await asyncio.to_thread(plan_segments, wav) if wav else None
+        try:
+            if segments is None or len(segments) == 1:
+                # Not splittable (or short): one call with the original file
+                result = await self._transcribe_retrying(lambda: file_chunks(audio.path), audio.content_type)
+                metadata = {**(result.get("metadata") or {}), "segments": 1}
+            else:
+                result = None
+                async with aclosing(self._fan_out(wav, segments)) as events:
+                    async for event in events:
+                        if event["event"] == "done":
+                            result = event["result"]
+                        else:
+                            yield event
+                metadata = {"segments": len(segments), "duration": segments[-1].end}
+        finally:
+            if wav is not None and wav != audio.path:
+                await remove_quietly(wav)
+        result = {**result, "metadata": {**metadata, "sha256": audio.sha256}}
+        await self.cache.put(key, result)
+        yield {"event": "done", "result": {**result, "metadata": {**result["metadata"], "cached": False}}}
+
+    async def _fan_out(self, wav: Path, segments):
+        fanout = asyncio.Semaphore(self.fanout)
+
+        async def run(segment):
+            async with fanout:
+                data = await asyncio.to_thread(read_segment, wav, segment)
+                return segment.index, await self._transcribe_retrying(lambda: data, "audio/wav")
+
+        tasks = [asyncio.create_task(run(segment)) for segment in segments]
+        results = [None] * len(segments)
+        try:
+            for finished, next_done in enumerate(asyncio.as_completed(tasks), start=1):
+                index, result = await next_done
+                results[index] = result
+                # Text is only reported for the unbroken run of segments from the start
+                ready = next((i for i, r in enumerate(results) if r is None), len(results))
+                yield {
+                    "event": "segment",
+                    "index": index,
+                    "completed": finished,
+                    "total": len(segments),
+                    "transcript": _alternative(stitch(segments[:ready], results[:ready])).get("transcript", ""),
+                }
+            yield {"event": "done", "result": stitch(segments, results)}
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def close(self):
+        await self.client.aclose()
+
+def create_transcription_service(backend_name: str = TRANSCRIPTION_BACKEND) -> TranscriptionService:
+    if backend_name not in BACKENDS:
+        raise ValueError(f"Unknown TRANSCRIPTION_BACKEND {backend_name!r}, expected one of {sorted(BACKENDS)}")
+    client = httpx.AsyncClient(
+        timeout=httpx.Timeout(TRANSCRIPTION_TIMEOUT, connect=TRANSCRIPTION_CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=TRANSCRIPTION_MAX_CONNECTIONS, max_keepalive_connections=TRANSCRIPTION_MAX_CONNECTIONS),
+    )
+    return TranscriptionService(BACKENDS[backend_name](client), client)
+
+def get_transcription(request: Request) -> TranscriptionService:
+    return request.app.state.transcription
@@ -0,0 +1,31 @@
+"""
+Local stand-in for Deepgram's /v1/listen, for tests and benchmarks without an API key.
+
+    uvicorn appfolder.transcription_stub:app --port 8001
+
+then run the backend with TRANSCRIPTION_BACKEND=local. TRANSCRIPTION_STUB_DELAY_MS
+adds a fixed delay per request to imitate provider latency.
+"""
+import asyncio
+import os
+from fastapi import FastAPI, Request
+
+TRANSCRIPTION_STUB_DELAY_MS = float(os.getenv('TRANSCRIPTION_STUB_DELAY_MS', '0'))
+
+app = FastAPI()
+
+@app.post("/v1/listen")
+async def listen(request: Request):
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+    if TRANSCRIPTION_STUB_DELAY_MS:
+        await asyncio.sleep(TRANSCRIPTION_STUB_DELAY_MS / 1000)
+    return {
+        "metadata": {"bytes": size, "stub": True},
+        "results": {
+            "channels": [
+                {"alternatives": [{"transcript": f"Transcript of {size} bytes of audio.", "confidence": 1.0}]}
+            ]
+        },
+    }
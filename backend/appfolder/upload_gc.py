@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from appfolder.storage import UPLOAD_DIR
+from appfolder.media import DERIVED_DIR, CONTENT_ADDRESSED_RE
+
+# Garbage collector settings (override in appfolder/.env)
+UPLOAD_GC_GRACE_HOURS = float(os.getenv('UPLOAD_GC_GRACE_HOURS', '24'))
+# Run the collector in the background every N hours; 0 disables it
+UPLOAD_GC_INTERVAL_HOURS = float(os.getenv('UPLOAD_GC_INTERVAL_HOURS', '0'))
+UPLOAD_GC_BATCH_SIZE = int(os.getenv('UPLOAD_GC_BATCH_SIZE', '1000'))
+
+logger = logging.getLogger("uvicorn.error")
+
+@dataclass
+class GCReport:
+    files: int = 0
+    bytes_total: int = 0
+    bytes_by_user: dict = field(default_factory=dict)
+    # Bytes only that user references, i.e. what deleting their data would free
+    bytes_exclusive_by_user: dict = field(default_factory=dict)
+    orphans: list = field(default_factory=list)
+    bytes_reclaimable: int = 0
+    deleted: int = 0
+    bytes_deleted: int = 0
+    # Orphans younger than the grace period, left alone in case their row is still being written
+    recent_orphans: int = 0
+
+    def as_dict(self):
+        return {
+            "files": self.files,
+            "bytes_total": self.bytes_total,
+            "bytes_by_user": self.bytes_by_user,
+            "bytes_exclusive_by_user": self.bytes_exclusive_by_user,
+            "orphans": len(self.orphans),
+            "bytes_reclaimable": self.bytes_reclaimable,
+            "recent_orphans": self.recent_orphans,
+            "deleted": self.deleted,
+            "bytes_deleted": self.bytes_deleted,
+        }
+
+def _upload_path(url):
+    # Stored references look like /uploads/blobs/ab/cd/<hash>.jpg
+    if not url or not url.startswith('/' + UPLOAD_DIR.as_posix() + '/'):
+        return None
+    return Path(url.lstrip('/'))
+
+async def collect_references(conn, batch_size=UPLOAD_GC_BATCH_SIZE):
+    """
+    {upload path: set of user ids} for every stories.photos and people.picture
+    reference, read in id-ordered batches so large tables are never loaded at once.
+    """
+    references = {}
+
+    def add(url, user_id):
+        path = _upload_path(url)
+        if path is not None:
+            references.setdefault(path, set()).add(str(user_id) if user_id is not None else None)
+
+    last_id = 0
+    while True:
+        rows = await conn.fetch('SELECT id, user_id, photos FROM stories WHERE id > $1 ORDER BY id LIMIT $2', last_id, batch_size)
+        for row in rows:
+            for url in row['photos'] or []:
+                add(url, row['user_id'])
+        if len(rows) < batch_size:
+            break
+        last_id = rows[-1]['id']
+    last_id = 0
+    while True:
+        rows = await conn.fetch('SELECT id, user_id, picture FROM people WHERE id > $1 AND picture IS NOT NULL ORDER BY id LIMIT $2', last_id, batch_size)
+        for row in rows:
+            add(row['picture'], row['user_id'])
+        if len(rows) < batch_size:
+            break
+        last_id = rows[-1]['id']
+    return references
+
+def reconcile(references, grace_hours=UPLOAD_GC_GRACE_HOURS, delete=False):
+    """
+    Walk the upload directory and compare it with the references. Derived images count
+    as referenced when their original blob is. Orphans older than the grace period are
+    reported as reclaimable and, with delete=True, removed.
+    """
+    report = GCReport()
+    referenced_hashes = set()
+    for path in references:
+        match = CONTENT_ADDRESSED_RE.match(path.name)
+        if match:
+            referenced_hashes.add(match.group(1))
+    cutoff = time.time() - grace_hours * 3600
+    for path in sorted(UPLOAD_DIR.rglob('*')):
+        if not path.is_file():
+            continue
+        stat = path.stat()
+        report.files += 1
+        report.bytes_total += stat.st_size
+        users = references.get(path)
+        if users:
+            for user_id in users:
+                report.bytes_by_user[user_id] = report.bytes_by_user.get(user_id, 0) + stat.st_size
+            if len(users) == 1:
+                (user_id,) = users
+                report.bytes_exclusive_by_user[user_id] = report.bytes_exclusive_by_user.get(user_id, 0) + stat.st_size
+            continue
+        if path.is_relative_to(DERIVED_DIR):
+            match = CONTENT_ADDRESSED_RE.match(path.name)
+            if match and match.group(1).split('_w')[0] in referenced_hashes:
+                continue
+        if stat.st_mtime > cutoff:
+            report.recent_orphans += 1
+            continue
+        report.orphans.append(path)
+        report.bytes_reclaimable += stat.st_size
+        if delete:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            report.deleted += 1
+            report.bytes_deleted += stat.st_size
+    return report
+
+async def collect_garbage(conn, grace_hours=UPLOAD_GC_GRACE_HOURS, delete=False, batch_size=UPLOAD_GC_BATCH_SIZE):
+    references = await collect_references(conn, batch_size)
+    # Walking the directory is blocking file system work
+    return await asyncio.to_thread(reconcile, references, grace_hours, delete)
+
+async def run_periodically(pool, interval_hours=UPLOAD_GC_INTERVAL_HOURS):
+    """Background task started from the lifespan when UPLOAD_GC_INTERVAL_HOURS > 0."""
+    while True:
+        await asyncio.sleep(interval_hours * 3600)
+        try:
+            async with pool.acquire() as conn:
+                report = await collect_garbage(conn, delete=True)
+            logger.info("Upload GC: %s", report.as_dict())
+        except Exception:
+            logger.warning("Upload GC failed", exc_info=True)
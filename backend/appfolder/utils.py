@@ -1,3 +1,7 @@
+import base64
+import binascii
+import json
+
 def serialize_row(row):
     d = dict(row)
     if 'user_id' in d and d['user_id'] is not None:
@@ -15,4 +19,20 @@ def generate_date(content: str) -> str:
     return datetime.now().strftime("%Y-%m-%d")
 
 def normalize_name(name):
-    return name.strip().lower().replace(' ', '_') 
\ No newline at end of file
+    return name.strip().lower().replace(' ', '_')
+
+def encode_cursor(*values):
+    """Pack keyset values (e.g. date and id of the last row) into an opaque URL-safe token."""
+    raw = json.dumps(list(values), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> list:
+    """Inverse of encode_cursor. Raises ValueError for tokens we did not issue."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
@@ -0,0 +1,26 @@
+import argparse
+import asyncio
+import json
+import asyncpg
+from appfolder.db import DATABASE_URL
+from appfolder.upload_gc import collect_garbage, UPLOAD_GC_GRACE_HOURS, UPLOAD_GC_BATCH_SIZE
+
+async def main(args):
+    conn = await asyncpg.connect(DATABASE_URL)
+    try:
+        report = await collect_garbage(conn, grace_hours=args.grace_hours, delete=args.delete, batch_size=args.batch_size)
+    finally:
+        await conn.close()
+
+    for path in report.orphans:
+        print(f"{'Deleted' if args.delete else 'Orphan'}: {path}")
+    print(json.dumps(report.as_dict(), indent=2))
+    if not args.delete and report.orphans:
+        print("Dry run; pass --delete to remove the orphans listed above.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find (and optionally delete) uploads no story or person refers to.")
+    parser.add_argument("--delete", action="store_true", help="delete orphans older than the grace period")
+    parser.add_argument("--grace-hours", type=float, default=UPLOAD_GC_GRACE_HOURS, help="ignore orphans younger than this")
+    parser.add_argument("--batch-size", type=int, default=UPLOAD_GC_BATCH_SIZE, help="rows read per query")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,43 @@
+import argparse
+import asyncio
+import sys
+import uuid
+import asyncpg
+from appfolder.db import DATABASE_URL
+from appfolder import migrations
+
+async def main(args):
+    conn = await asyncpg.connect(DATABASE_URL)
+    try:
+        if args.command == "apply":
+            applied = await migrations.apply(conn, target=args.target)
+            print(f"Applied: {', '.join(applied)}" if applied else "Nothing to apply.")
+        elif args.command == "status":
+            for row in await migrations.status(conn):
+                state = f"applied {row['applied_at']}" if row['applied_at'] else "pending"
+                if row['modified']:
+                    state += " (file changed since it was applied)"
+                print(f"{row['version']}_{row['name']}: {state}")
+        elif args.command == "check":
+            # Imported here so apply/status work without the app's route dependencies
+            from appfolder.migrations.checks import check_indexes
+            user_id = args.user_id or await conn.fetchval('SELECT user_id::text FROM people LIMIT 1') or str(uuid.uuid4())
+            failed = 0
+            for result in await check_indexes(conn, user_id):
+                mark = "ok  " if result["ok"] else "FAIL"
+                failed += not result["ok"]
+                print(f"{mark} {result['endpoint']}: expects {result['index']}, plan uses {', '.join(result['indexes_used']) or 'no index'}")
+            return 1 if failed else 0
+    finally:
+        await conn.close()
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply schema migrations and check that queries use their indexes.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    apply_parser = commands.add_parser("apply", help="apply pending migrations")
+    apply_parser.add_argument("--target", help="stop after this version (e.g. 0002)")
+    commands.add_parser("status", help="list migrations and whether they are applied")
+    check_parser = commands.add_parser("check", help="EXPLAIN the hot queries and verify they use index scans")
+    check_parser.add_argument("--user-id", help="user to plan the queries for (default: any existing user)")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -2,7 +2,8 @@ import { useState, useEffect } from 'react';
 import PersonAvatar from './PersonAvatar';
 import { getPerson } from './api';
 
-function LocationCard({ location, stories }) {
+// count is the location's total; stories may hold only the newest few of them
+function LocationCard({ location, stories, count = stories.length }) {
   const [isExpanded, setIsExpanded] = useState(false);
   const [peopleNames, setPeopleNames] = useState({});
 
@@ -36,7 +37,7 @@ function LocationCard({ location, stories }) {
               {location === "Uncategorized" ? "📁 Uncategorized Stories" : `📍 ${location}`}
             </h2>
             <p className="text-gray-600 dark:text-gray-400 mt-1">
-              {stories.length} {stories.length === 1 ? 'story' : 'stories'}
+              {count} {count === 1 ? 'story' : 'stories'}
             </p>
           </div>
           <div className="text-gray-400 dark:text-gray-500">
@@ -61,7 +62,7 @@ function LocationCard({ location, stories }) {
                   {story.title}
                 </h3>
                 <p className="text-gray-700 dark:text-gray-200 mb-2">
-                  {story.content}
+                  {story.excerpt ?? story.content}
                 </p>
                 {story.date && (
                   <p className="text-sm text-gray-500 dark:text-gray-400">
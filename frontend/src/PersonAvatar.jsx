@@ -1,5 +1,5 @@
 import { useState, useEffect } from 'react';
-import { getPerson } from './api';
+import { getPerson, mediaUrl } from './api';
 
 function PersonAvatar({ person, size = "small" }) {
   const [personData, setPersonData] = useState(null);
@@ -18,6 +18,13 @@ function PersonAvatar({ person, size = "small" }) {
     large: "w-12 h-12"
   };
 
+  // Twice the rendered size so avatars stay sharp on high-DPI screens
+  const mediaWidths = {
+    small: 64,
+    medium: 64,
+    large: 128
+  };
+
   const textSizes = {
     small: "text-xs",
     medium: "text-sm",
@@ -36,7 +43,7 @@ function PersonAvatar({ person, size = "small" }) {
     <div className="inline-flex items-center">
       {personData && personData.picture ? (
         <img 
-          src={`http://localhost:8000${personData.picture}`}
+          src={mediaUrl(personData.picture, mediaWidths[size])}
           alt={personData ? personData.name : person}
           className={`${sizeClasses[size]} rounded-full object-cover border border-gray-200 dark:border-gray-600 transition-colors duration-200`}
         />
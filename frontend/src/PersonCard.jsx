@@ -1,22 +1,38 @@
 import { useState, useEffect } from 'react';
 import StoryCard from './StoryCard';
-import { getPerson, uploadPersonPicture } from './api';
+import { fetchPersonStories, uploadPersonPicture, mediaUrl } from './api';
 
-function PersonCard({ person, stories }) {
+// person is a row from GET /people, including its story_count. The stories
+// themselves are loaded a page at a time the first time the card is opened.
+function PersonCard({ person }) {
   const [isExpanded, setIsExpanded] = useState(false);
-  const [personData, setPersonData] = useState(null);
+  const [personData, setPersonData] = useState(person);
   const [isUploading, setIsUploading] = useState(false);
+  const [stories, setStories] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [isLoading, setIsLoading] = useState(false);
 
   useEffect(() => {
-    if (person !== "Uncategorized") {
-      console.log("Getting person data for", person);
-      getPerson(person).then(setPersonData).catch(() => {
-        setPersonData({ id: person, picture: null, name: "Unknown" });
-      });
-    }
+    setPersonData(person);
   }, [person]);
 
+  const loadStories = async (cursor) => {
+    setIsLoading(true);
+    try {
+      const page = await fetchPersonStories(person.id, { cursor });
+      setStories(prev => (cursor && prev ? [...prev, ...page.stories] : page.stories));
+      setNextCursor(page.next_cursor);
+    } catch (error) {
+      console.error('Failed to load stories:', error);
+    } finally {
+      setIsLoading(false);
+    }
+  };
+
   const toggleExpand = () => {
+    if (!isExpanded && stories === null) {
+      loadStories(null);
+    }
     setIsExpanded(!isExpanded);
   };
 
@@ -26,7 +42,7 @@ function PersonCard({ person, stories }) {
 
     setIsUploading(true);
     try {
-      const result = await uploadPersonPicture(person, file);
+      const result = await uploadPersonPicture(person.id, file);
       setPersonData(prev => ({ ...prev, picture: result.url }));
     } catch (error) {
       console.error('Failed to upload picture:', error);
@@ -44,12 +60,12 @@ function PersonCard({ person, stories }) {
       >
         <div className="flex items-center justify-between">
           <div className="flex items-center space-x-4">
-            {person !== "Uncategorized" && personData && (
+            {personData && (
               <div className="relative">
                 {personData.picture ? (
                   <img 
-                    src={`http://localhost:8000${personData.picture}`}
-                    alt={personData.name || person}
+                    src={mediaUrl(personData.picture, 128)}
+                    alt={personData.name}
                     className="w-16 h-16 rounded-full object-cover border-2 border-gray-200 dark:border-gray-600"
                   />
                 ) : (
@@ -57,26 +73,27 @@ function PersonCard({ person, stories }) {
                     <span className="text-2xl">👤</span>
                   </div>
                 )}
-                {person !== "Uncategorized" && (
-                  <label className="absolute bottom-0 right-0 bg-white dark:bg-gray-700 rounded-full p-1 shadow cursor-pointer border border-gray-200 dark:border-gray-600 hover:shadow-lg transition-shadow duration-200">
-                    <input
-                      type="file"
-                      accept="image/*"
-                      className="hidden"
-                      onChange={handleFileUpload}
-                      disabled={isUploading}
-                    />
-                    <span role="img" aria-label="Upload" className="text-xs">📷</span>
-                  </label>
-                )}
+                <label className="absolute bottom-0 right-0 bg-white dark:bg-gray-700 rounded-full p-1 shadow cursor-pointer border border-gray-200 dark:border-gray-600 hover:shadow-lg transition-shadow duration-200">
+                  <input
+                    type="file"
+                    accept="image/*"
+                    className="hidden"
+                    onChange={handleFileUpload}
+                    disabled={isUploading}
+                  />
+                  <span role="img" aria-label="Upload" className="text-xs">📷</span>
+                </label>
               </div>
             )}
             {/* Display the person's name */}
-            <span className="font-bold text-lg text-gray-900 dark:text-gray-100">
-              {person === "Uncategorized"
-                ? "Uncategorized"
-                : (personData?.name || "Unknown")}
-            </span>
+            <div>
+              <span className="font-bold text-lg text-gray-900 dark:text-gray-100">
+                {personData?.name || "Unknown"}
+              </span>
+              <p className="text-gray-600 dark:text-gray-400">
+                {person.story_count} {person.story_count === 1 ? 'story' : 'stories'}
+              </p>
+            </div>
           </div>
           <button
             className="ml-4 text-blue-600 dark:text-blue-400 hover:underline transition-colors duration-200"
@@ -93,7 +110,18 @@ function PersonCard({ person, stories }) {
               <StoryCard key={story.id} story={story} />
             ))
           ) : (
-            <div className="text-gray-500 dark:text-gray-400">No stories for this person.</div>
+            <div className="text-gray-500 dark:text-gray-400">
+              {isLoading ? 'Loading stories...' : 'No stories for this person.'}
+            </div>
+          )}
+          {nextCursor && (
+            <button
+              className="mt-4 text-blue-600 dark:text-blue-400 hover:underline transition-colors duration-200"
+              onClick={() => loadStories(nextCursor)}
+              disabled={isLoading}
+            >
+              {isLoading ? 'Loading...' : 'Load more stories'}
+            </button>
           )}
         </div>
       )}
@@ -1,10 +1,8 @@
 import { useState, useEffect } from 'react';
-import { patchStoryTitle, uploadStoryPhotos, getPerson, fetchLocations, patchStoryLocation } from './api';
+import { patchStoryTitle, uploadStoryPhotos, getPerson, fetchLocations, patchStoryLocation, mediaUrl } from './api';
 import { useFloating, offset, flip, shift } from '@floating-ui/react';
 import PersonAvatar from './PersonAvatar';
 
-const API_URL = 'http://localhost:8000'; // adjust if needed
-
 function StoryCard({ story, onTitleUpdate, handleDelete, onDateUpdate, onPeopleUpdate, onLocationUpdate }) {
     const [isEditing, setIsEditing] = useState(false);
     const [editedTitle, setEditedTitle] = useState(story.title);
@@ -118,7 +116,7 @@ function StoryCard({ story, onTitleUpdate, handleDelete, onDateUpdate, onPeopleU
                     {story.photos.map((photoUrl, idx) => (
                         <img
                             key={`${story.id}-photo-${idx}`}
-                            src={photoUrl.startsWith('http') ? photoUrl : `${API_URL}${photoUrl}`}
+                            src={mediaUrl(photoUrl, 256)}
                             alt={`Story Photo ${idx + 1}`}
                             className="w-32 h-32 object-cover rounded border border-gray-200 dark:border-gray-600"
                         />
@@ -3,16 +3,34 @@ import { supabase } from './supabaseClient';
 
 const API_URL = 'http://localhost:8000'; // FastAPI default
 
+// URL for an uploaded image at (about) the given display width. Content-addressed
+// uploads are served resized from /media; anything else falls back to the original.
+export const mediaUrl = (path, width) => {
+  if (!path) return path;
+  if (path.startsWith('http')) return path;
+  const match = path.match(/^\/uploads\/blobs\/.*\/([0-9a-f]{64})\.[^/]+$/);
+  if (match && width) return `${API_URL}/media/${match[1]}?w=${width}`;
+  return `${API_URL}${path}`;
+};
+
 // Get the current user ID from Supabase
 const getCurrentUserId = async () => {
   const { data: { user } } = await supabase.auth.getUser();
   return user?.id;
 };
 
-export const fetchStories = async () => {
+// Fetch one page of stories, newest first. Returns { stories, next_cursor };
+// pass next_cursor back in to get the following page (null on the last page).
+// from/to limit the page to a date window ("1962-06-01", "1950s", "summer 1962").
+export const fetchStoriesPage = async ({ cursor, limit = 50, from, to } = {}) => {
   try {
     const userId = await getCurrentUserId();
-    const response = await axios.get(`${API_URL}/stories${userId ? `?user_id=${userId}` : ''}`);
+    const params = { limit };
+    if (userId) params.user_id = userId;
+    if (cursor) params.cursor = cursor;
+    if (from) params.from = from;
+    if (to) params.to = to;
+    const response = await axios.get(`${API_URL}/stories`, { params });
     return response.data;
   } catch (error) {
     console.error('Error fetching stories:', error);
@@ -20,6 +38,68 @@ export const fetchStories = async () => {
   }
 };
 
+// Fetch every story by paging through /stories
+export const fetchStories = async () => {
+  const stories = [];
+  let cursor = null;
+  do {
+    const page = await fetchStoriesPage({ cursor, limit: 200 });
+    stories.push(...page.stories);
+    cursor = page.next_cursor;
+  } while (cursor);
+  return stories;
+};
+
+// Full-text search over the current user's stories, best match first. Returns
+// { stories, next_cursor }; each story has a `snippet` with matches in <mark>.
+export const searchStories = async ({ q, cursor, limit = 20 }) => {
+  try {
+    const userId = await getCurrentUserId();
+    const params = { q, limit };
+    if (userId) params.user_id = userId;
+    if (cursor) params.cursor = cursor;
+    const response = await axios.get(`${API_URL}/stories/search`, { params });
+    return response.data;
+  } catch (error) {
+    console.error('Error searching stories:', error);
+    throw error;
+  }
+};
+
+// Story counts per year, decade or location with the newest `top` story summaries
+// of each bucket. Returns { by, buckets: [{ key, label, count, stories }] }.
+export const fetchStoryAggregate = async ({ by = 'year', top, from, to } = {}) => {
+  try {
+    const userId = await getCurrentUserId();
+    const params = { by };
+    if (userId) params.user_id = userId;
+    if (top) params.top = top;
+    if (from) params.from = from;
+    if (to) params.to = to;
+    const response = await axios.get(`${API_URL}/stories/aggregate`, { params });
+    return response.data;
+  } catch (error) {
+    console.error('Error fetching story aggregate:', error);
+    throw error;
+  }
+};
+
+// One page of the stories that mention a person, newest first. Returns
+// { person_id, stories, next_cursor }.
+export const fetchPersonStories = async (personId, { cursor, limit = 50 } = {}) => {
+  try {
+    const userId = await getCurrentUserId();
+    const params = { limit };
+    if (userId) params.user_id = userId;
+    if (cursor) params.cursor = cursor;
+    const response = await axios.get(`${API_URL}/people/${personId}/stories`, { params });
+    return response.data;
+  } catch (error) {
+    console.error('Error fetching person stories:', error);
+    throw error;
+  }
+};
+
 export const postStory = async (storyData) => {
   try {
     const userId = await getCurrentUserId();
@@ -101,6 +181,18 @@ export const deleteStory = async (storyId) => {
   }
 };
 
+// Update several story fields at once, e.g. { title, date, people_ids, location_name }
+export const patchStory = async (storyId, fields) => {
+  try {
+    const userId = await getCurrentUserId();
+    const response = await axios.patch(`${API_URL}/stories/${storyId}${userId ? `?user_id=${userId}` : ''}`, fields);
+    return response.data;
+  } catch (error) {
+    console.error('Error updating story:', error);
+    throw error;
+  }
+};
+
 export const patchStoryTitle = async (storyId, title) => {
   try {
     const userId = await getCurrentUserId();
@@ -181,38 +273,23 @@ export const addPerson = async (personData) => {
   }
 };
 
-export const updatePersonBirthDate = async (personId, birthDate) => {
+// Update several person fields at once, e.g. { birth_date, death_date, gender }
+export const patchPerson = async (personId, fields) => {
   try {
     const userId = await getCurrentUserId();
-    const response = await axios.patch(`${API_URL}/people/${personId}/birth-date${userId ? `?user_id=${userId}` : ''}`, { birth_date: birthDate });
+    const response = await axios.patch(`${API_URL}/people/${personId}${userId ? `?user_id=${userId}` : ''}`, fields);
     return response.data;
   } catch (error) {
-    console.error('Error updating person birth date:', error);
+    console.error('Error updating person:', error);
     throw error;
   }
 };
 
-export const updatePersonDeathDate = async (personId, deathDate) => {
-  try {
-    const userId = await getCurrentUserId();
-    const response = await axios.patch(`${API_URL}/people/${personId}/death-date${userId ? `?user_id=${userId}` : ''}`, { death_date: deathDate });
-    return response.data;
-  } catch (error) {
-    console.error('Error updating person death date:', error);
-    throw error;
-  }
-};
+export const updatePersonBirthDate = (personId, birthDate) => patchPerson(personId, { birth_date: birthDate });
 
-export const updatePersonGender = async (personId, gender) => {
-  try {
-    const userId = await getCurrentUserId();
-    const response = await axios.patch(`${API_URL}/people/${personId}/gender${userId ? `?user_id=${userId}` : ''}`, { gender });
-    return response.data;
-  } catch (error) {
-    console.error('Error updating person gender:', error);
-    throw error;
-  }
-};
+export const updatePersonDeathDate = (personId, deathDate) => patchPerson(personId, { death_date: deathDate });
+
+export const updatePersonGender = (personId, gender) => patchPerson(personId, { gender });
 
 export const fetchRelationships = async () => {
   try {
@@ -286,10 +363,15 @@ export const deleteFriendship = async (person1Id, person2Id) => {
   }
 };
 
-export const fetchFamilyTree = async () => {
+// Pass rootId (and optionally depth) to load one subtree instead of the whole family
+export const fetchFamilyTree = async ({ rootId, depth } = {}) => {
   try {
     const userId = await getCurrentUserId();
-    const response = await axios.get(`${API_URL}/family-tree${userId ? `?user_id=${userId}` : ''}`);
+    const params = {};
+    if (userId) params.user_id = userId;
+    if (rootId != null) params.root_id = rootId;
+    if (depth != null) params.depth = depth;
+    const response = await axios.get(`${API_URL}/family-tree`, { params });
     return response.data;
   } catch (error) {
     console.error('Error fetching family tree:', error);
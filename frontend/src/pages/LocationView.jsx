@@ -1,39 +1,16 @@
 import { useState, useEffect } from "react";
 import { Link } from "react-router-dom";
-import { fetchStories } from '../api';
+import { fetchStoryAggregate } from '../api';
 import LocationCard from '../LocationCard';
 
 export default function LocationView() {
-  const [stories, setStories] = useState([]);
-  const [locationMap, setLocationMap] = useState({});
+  const [buckets, setBuckets] = useState([]);
 
+  // The server groups stories by location and sends counts plus the newest few of each
   useEffect(() => {
-    fetchStories().then(setStories);
+    fetchStoryAggregate({ by: 'location', top: 10 }).then(data => setBuckets(data.buckets));
   }, []);
 
-  // Group stories by location
-  useEffect(() => {
-    const grouped = {};
-    
-    stories.forEach(story => {
-      if (story.location_name && story.location_name.trim()) {
-        const location = story.location_name.trim();
-        if (!grouped[location]) {
-          grouped[location] = [];
-        }
-        grouped[location].push(story);
-      } else {
-        // Stories without location go to "Uncategorized"
-        if (!grouped["Uncategorized"]) {
-          grouped["Uncategorized"] = [];
-        }
-        grouped["Uncategorized"].push(story);
-      }
-    });
-
-    setLocationMap(grouped);
-  }, [stories]);
-
   return (
     <div className="min-h-screen bg-gray-50 dark:bg-gray-900 px-6 py-12 transition-colors duration-300">
       <div className="mb-6">
@@ -47,17 +24,19 @@ export default function LocationView() {
       </div>
       <h1 className="text-3xl font-bold mb-12 text-center text-gray-900 dark:text-gray-100">📍 Stories by Location</h1>
       
-      {Object.keys(locationMap).length === 0 ? (
+      {buckets.length === 0 ? (
         <div className="text-center text-gray-600 dark:text-gray-400">
           <p>No stories found. Add some stories with locations to see them categorized here.</p>
         </div>
       ) : (
         <div className="space-y-8">
-          {Object.entries(locationMap).map(([location, locationStories]) => (
+          {/* Stories without a location come back under a null key and go to "Uncategorized" */}
+          {buckets.map(bucket => (
             <LocationCard
-              key={location}
-              location={location}
-              stories={locationStories}
+              key={bucket.key ?? 'uncategorized'}
+              location={bucket.label ?? "Uncategorized"}
+              stories={bucket.stories}
+              count={bucket.count}
             />
           ))}
         </div>
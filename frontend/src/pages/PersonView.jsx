@@ -1,12 +1,10 @@
 import { useState, useEffect } from "react";
 import { Link } from "react-router-dom";
-import { fetchStories, fetchPeople, postPerson, addPerson, getPerson, updatePersonPicture, updatePersonBirthDate, updatePersonDeathDate, updatePersonGender, uploadPersonPicture } from '../api';
+import { fetchPeople, postPerson, addPerson, getPerson, updatePersonPicture, updatePersonBirthDate, updatePersonDeathDate, updatePersonGender, uploadPersonPicture } from '../api';
 import { useAuth } from '../contexts/AuthContext';
 import PersonCard from '../PersonCard';
 
 export default function PersonView() {
-  const [stories, setStories] = useState([]);
-  const [peopleMap, setPeopleMap] = useState({});
   const [people, setPeople] = useState([]);
   const [newPersonName, setNewPersonName] = useState('');
   const [showAddForm, setShowAddForm] = useState(false);
@@ -17,41 +15,15 @@ export default function PersonView() {
   const [newPicture, setNewPicture] = useState(null);
   const { user } = useAuth();
 
-  // When fetching people, store by id
+  // GET /people carries each person's story_count; their stories are loaded
+  // by PersonCard only when it is opened
   useEffect(() => {
     if (user) {
-      fetchStories().then(setStories);
-      fetchPeople().then(peopleList => {
-        setPeople(peopleList);
-        // Optionally, build a map by id for quick lookup
-        // setPeopleMap(Object.fromEntries(peopleList.map(p => [p.id, p])));
-      });
+      fetchPeople().then(setPeople);
     }
   }, [user]);
 
-  // When grouping stories by people, use person id
-  useEffect(() => {
-    const grouped = {};
-    
-    stories.forEach(story => {
-      if (story.people_ids && story.people_ids.length > 0) {
-        story.people_ids.forEach(personId => {
-          if (!grouped[personId]) {
-            grouped[personId] = [];
-          }
-          grouped[personId].push(story);
-        });
-      } else {
-        // Stories without people go to "Uncategorized"
-        if (!grouped["Uncategorized"]) {
-          grouped["Uncategorized"] = [];
-        }
-        grouped["Uncategorized"].push(story);
-      }
-    });
-
-    setPeopleMap(grouped);
-  }, [stories]);
+  const peopleWithStories = people.filter(person => person.story_count > 0);
 
   const handleAddPerson = async (e) => {
     e.preventDefault();
@@ -77,7 +49,7 @@ export default function PersonView() {
         }
       }
 
-      setPeople([...people, result]);
+      setPeople([...people, { ...result, story_count: 0 }]);
       setNewPersonName('');
       setNewGender('');
       setNewBirthDate('');
@@ -170,17 +142,16 @@ export default function PersonView() {
         )}
       </div>
       
-      {Object.keys(peopleMap).length === 0 ? (
+      {peopleWithStories.length === 0 ? (
         <div className="text-center text-gray-600 dark:text-gray-400">
           <p>No stories found. Add some stories with people to see them categorized here.</p>
         </div>
       ) : (
         <div className="space-y-8">
-          {Object.entries(peopleMap).map(([person, personStories]) => (
+          {peopleWithStories.map(person => (
             <PersonCard
-              key={person}
-              person={person === "Uncategorized" ? person : Number(person)}
-              stories={personStories}
+              key={person.id}
+              person={person}
             />
           ))}
         </div>